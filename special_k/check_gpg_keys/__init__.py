@@ -1,13 +1,22 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-import glob
 import json
 import os
+import re
 import string
 
 
 _KEYNAME_TO_FINGERPRINT_FILE = "keyname-to-fingerprint.json"
 _TRUSTDB_FILE = "trustdb.txt"
 ALLOWED_FINGERPRINT_CHARACTERS = set(string.ascii_uppercase + string.digits)
+# A valid fingerprint is exactly 40 uppercase letters and digits.
+_FINGERPRINT_RE = re.compile(r"[A-Z0-9]{40}\Z")
+
+# Caches for the trusted-key lookups below, keyed on the trusted keys directory. The directory
+# contents are static for the life of a process, but the directory itself comes from an
+# environment variable that may legitimately change (e.g. in tests), so the caches are keyed
+# on the resolved directory rather than simply memoizing the functions outright.
+_keyname_to_fingerprint_cache = {}
+_trusted_pub_keys_cache = {}
 
 
 def get_trusted_keys_dir():
@@ -21,19 +30,24 @@ def get_trusted_keys_dir():
     return trusted_keys_dir
 
 
-def _verify_trusted_keys_dir(trusted_keys_dir):
+def _list_trusted_keys_dir(trusted_keys_dir):
+    """Return the filenames in the trusted keys directory, scanning it exactly once."""
+    with os.scandir(trusted_keys_dir) as entries:
+        return [entry.name for entry in entries]
+
+
+def _verify_trusted_keys_dir(trusted_keys_dir, filenames=None):
     """Verify that a trusted keys directory has the proper contents"""
-    files = glob.glob(os.path.join(trusted_keys_dir, "*"))
-    has_pub_key = any(filepath.endswith(".pub.asc") for filepath in files)
+    if filenames is None:
+        filenames = _list_trusted_keys_dir(trusted_keys_dir)
+    has_pub_key = any(filename.endswith(".pub.asc") for filename in filenames)
     if not has_pub_key:
-        raise ValueError("No public keys found in directory {}, {}".format(trusted_keys_dir, files))
-    has_trustdb = any(os.path.split(filepath)[-1] == _TRUSTDB_FILE for filepath in files)
-    if not has_trustdb:
+        raise ValueError(
+            "No public keys found in directory {}, {}".format(trusted_keys_dir, filenames)
+        )
+    if _TRUSTDB_FILE not in filenames:
         raise ValueError("No `{}` found in directory {}".format(_TRUSTDB_FILE, trusted_keys_dir))
-    has_fingerprint_json = any(
-        os.path.split(filepath)[-1] == _KEYNAME_TO_FINGERPRINT_FILE for filepath in files
-    )
-    if not has_fingerprint_json:
+    if _KEYNAME_TO_FINGERPRINT_FILE not in filenames:
         raise ValueError(
             "No file `{}` found in {}.".format(_KEYNAME_TO_FINGERPRINT_FILE, trusted_keys_dir)
         )
@@ -41,12 +55,7 @@ def _verify_trusted_keys_dir(trusted_keys_dir):
 
 def _is_fingerprint_valid(fingerprint):
     """Validate that a fingerprint is in the right format"""
-    if len(fingerprint) != 40:
-        return False
-    elif set(fingerprint).difference(ALLOWED_FINGERPRINT_CHARACTERS):
-        return False
-    else:
-        return True
+    return _FINGERPRINT_RE.match(fingerprint) is not None
 
 
 def _validate_keyname_to_fingerprint_item(keyname, fingerprint):
@@ -69,17 +78,27 @@ def _validate_keyname_to_fingerprint_item(keyname, fingerprint):
 def get_keyname_to_fingerprint():
     """Get a map of pub key filename to fingerprint"""
     trusted_keys_dir = get_trusted_keys_dir()
-    filepath = os.path.join(trusted_keys_dir, _KEYNAME_TO_FINGERPRINT_FILE)
-    with open(filepath, "r") as fi:
-        keyname_to_fingerprint = json.load(fi)
-    for keyname, fingerprint in keyname_to_fingerprint.items():
-        _validate_keyname_to_fingerprint_item(keyname, fingerprint)
-    return keyname_to_fingerprint
+    keyname_to_fingerprint = _keyname_to_fingerprint_cache.get(trusted_keys_dir)
+    if keyname_to_fingerprint is None:
+        filepath = os.path.join(trusted_keys_dir, _KEYNAME_TO_FINGERPRINT_FILE)
+        with open(filepath, "r") as fi:
+            keyname_to_fingerprint = json.load(fi)
+        for keyname, fingerprint in keyname_to_fingerprint.items():
+            _validate_keyname_to_fingerprint_item(keyname, fingerprint)
+        _keyname_to_fingerprint_cache[trusted_keys_dir] = keyname_to_fingerprint
+    # return a copy so that callers cannot mutate the cached mapping
+    return dict(keyname_to_fingerprint)
 
 
 def get_trusted_pub_keys():
     """Get the trusted pub key files"""
     trusted_keys_dir = get_trusted_keys_dir()
-    _verify_trusted_keys_dir(trusted_keys_dir)
-    pub_key_files = glob.glob(os.path.join(trusted_keys_dir, "*.pub.asc"))
-    return frozenset(os.path.basename(filepath) for filepath in pub_key_files)
+    trusted_pub_keys = _trusted_pub_keys_cache.get(trusted_keys_dir)
+    if trusted_pub_keys is None:
+        filenames = _list_trusted_keys_dir(trusted_keys_dir)
+        _verify_trusted_keys_dir(trusted_keys_dir, filenames=filenames)
+        trusted_pub_keys = frozenset(
+            filename for filename in filenames if filename.endswith(".pub.asc")
+        )
+        _trusted_pub_keys_cache[trusted_keys_dir] = trusted_pub_keys
+    return trusted_pub_keys
@@ -1,32 +1,39 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-from io import BytesIO
-from os import path
 from tarfile import TarFile
-from types import ModuleType
+from types import MappingProxyType, ModuleType
 from typing import Tuple
 
 from . import metadata_format_v3
 from ..exceptions import SerializationError
 from ..serializable_model import SerializableModel
 from ..utils import (
-    consume_stream_into_tarball,
     get_model_directory_name,
+    get_tarball_members_by_name,
     make_model_directory,
     open_readonly_tarball_file,
+    write_bytes_into_tarball,
 )
 
 
 META_VERSION_FILENAME = "meta.version"
-RECOGNIZED_METADATA_VERSIONS = {
-    metadata_format_v3.METADATA_FORMAT_VERSION: metadata_format_v3,
-    # More versions can be added here
-}
+# Read-only view so the set of recognized versions cannot be mutated behind our back.
+RECOGNIZED_METADATA_VERSIONS = MappingProxyType(
+    {
+        metadata_format_v3.METADATA_FORMAT_VERSION: metadata_format_v3,
+        # More versions can be added here
+    }
+)
+# The preferred format for new models is the highest recognized version. Since the version map
+# is fixed at import time, compute this once instead of taking a max() on every save.
+_CURRENT_METADATA_FORMAT_VERSION = max(RECOGNIZED_METADATA_VERSIONS.keys())
 
 
 def get_current_metadata_format() -> Tuple[int, ModuleType]:
     """Return the version number and module that has the preferred way to serialize new models."""
-    max_version = max(RECOGNIZED_METADATA_VERSIONS.keys())
-    return max_version, RECOGNIZED_METADATA_VERSIONS[max_version]
+    return (
+        _CURRENT_METADATA_FORMAT_VERSION,
+        RECOGNIZED_METADATA_VERSIONS[_CURRENT_METADATA_FORMAT_VERSION],
+    )
 
 
 def load_from_tarfile(tar_file: TarFile, **kwargs) -> SerializableModel:
@@ -45,11 +52,17 @@ def load_from_tarfile(tar_file: TarFile, **kwargs) -> SerializableModel:
         SerializationError, if the tar_file is not a valid model file.
         IntegrityError, if the serialized model fails integrity checks.
     """
-    model_directory = get_model_directory_name(tar_file)
-    meta_version_path = path.join(model_directory, META_VERSION_FILENAME)
+    # Index the tarball members once up front; every lookup below, including those inside
+    # the version-specific loader, reuses the map instead of rescanning the member list.
+    members_by_name = get_tarball_members_by_name(tar_file)
+    model_directory = get_model_directory_name(tar_file, members_by_name=members_by_name)
+    # Tar member paths always use "/" regardless of OS.
+    meta_version_path = "{}/{}".format(model_directory, META_VERSION_FILENAME)
 
     # Read the metadata format version.
-    with open_readonly_tarball_file(tar_file, meta_version_path) as f:
+    with open_readonly_tarball_file(
+        tar_file, meta_version_path, members_by_name=members_by_name
+    ) as f:
         version = int(f.read())
 
     metadata_format = RECOGNIZED_METADATA_VERSIONS.get(version, None)
@@ -61,7 +74,7 @@ def load_from_tarfile(tar_file: TarFile, **kwargs) -> SerializableModel:
             )
         )
 
-    return metadata_format.load_from_tarfile(tar_file, **kwargs)
+    return metadata_format.load_from_tarfile(tar_file, members_by_name=members_by_name, **kwargs)
 
 
 def save_to_tarfile(tar_file: TarFile, model: SerializableModel, **kwargs) -> None:
@@ -78,11 +91,10 @@ def save_to_tarfile(tar_file: TarFile, model: SerializableModel, **kwargs) -> No
     version_number, metadata_serializer = get_current_metadata_format()
 
     # Write the metadata format version.
-    meta_version_path = path.join(model_directory, META_VERSION_FILENAME)
-    stream = BytesIO()
-    version_str = str(version_number) + "\n"
-    stream.write(version_str.encode("utf-8"))
-    consume_stream_into_tarball(tar_file, meta_version_path, stream)
+    # Tar member paths always use "/" regardless of OS.
+    meta_version_path = "{}/{}".format(model_directory, META_VERSION_FILENAME)
+    version_bytes = "{}\n".format(version_number).encode("utf-8")
+    write_bytes_into_tarball(tar_file, meta_version_path, version_bytes)
 
     # Write the actual model into the tarball.
     metadata_serializer.save_to_tarfile(tar_file, model, model_directory, **kwargs)
@@ -1,11 +1,14 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from io import BytesIO
 import json
 import logging
 import os
 from tarfile import TarFile
-from typing import Any, Dict, Optional, Set
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
 
 import voluptuous
 from voluptuous import All, Invalid, Schema, validate
@@ -22,7 +25,9 @@ from ..utils import (
     filename_safe_string,
     get_installed_packages,
     get_model_directory_name,
+    get_tarball_members_by_name,
     open_readonly_tarball_file,
+    write_bytes_into_tarball,
 )
 
 
@@ -42,6 +47,12 @@ METADATA_KEY_INSTALLED_PACKAGES = "installed_packages"
 
 logger = logging.getLogger(__name__)
 
+# The metadata written on save is assembled entirely by this module from already-validated
+# inputs, so re-walking the full schema on every save is purely defensive. Set this env var
+# to any non-empty value to turn that check back on (e.g. when debugging a custom
+# serializer). The load path always validates, since its bytes come from disk.
+VALIDATE_METADATA_ON_WRITE_ENV_VAR = "SPECIAL_K_VALIDATE_METADATA_ON_WRITE"
+
 
 def stream_descriptor(pickle_only: bool = False) -> Schema:
     """Produce a validator for stream descriptors, optionally allowing only pickled format."""
@@ -88,15 +99,81 @@ metadata_format = Schema(
 metadata_type = Dict[str, Any]
 
 
+# Shared pool for attribute (de)serialization, created lazily on first use so processes
+# that never save/load models pay nothing. Reusing one pool across calls amortizes OS
+# thread startup over many serializations.
+_serialization_pool = None
+_serialization_pool_lock = threading.Lock()
+# Worker count for the shared pool, also used to bound in-flight work on the load path.
+_SERIALIZATION_POOL_MAX_WORKERS = os.cpu_count() or 1
+
+
+def _get_serialization_pool() -> ThreadPoolExecutor:
+    """Return the shared serialization thread pool, creating it on first use."""
+    global _serialization_pool
+    if _serialization_pool is None:
+        with _serialization_pool_lock:
+            if _serialization_pool is None:
+                _serialization_pool = ThreadPoolExecutor(
+                    max_workers=_SERIALIZATION_POOL_MAX_WORKERS,
+                    thread_name_prefix="special_k_serialization",
+                )
+    return _serialization_pool
+
+
+def _discard_serialization_pool_after_fork() -> None:
+    """Drop the shared pool in a forked child, whose worker threads did not survive the fork."""
+    global _serialization_pool
+    _serialization_pool = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_discard_serialization_pool_after_fork)
+
+
+def _map_possibly_in_parallel(func: Callable[[Any], Any], items: Sequence[Any]) -> List[Any]:
+    """Map func over items, fanning out to the shared pool when there is more than one item.
+
+    Results are returned in the order of the input items.
+    """
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    return list(_get_serialization_pool().map(func, items))
+
+
+def _read_item_stream_from_tarfile(
+    tar_file: TarFile, model_directory: str, stream_data: dict, members_by_name: dict = None
+) -> BytesIO:
+    """Read a single item's raw bytes out of the tarfile into an in-memory stream."""
+    logger.info("Loading file %s", stream_data["filename"])
+    # Tar member paths always use "/" regardless of OS, so plain concatenation is both
+    # correct and cheaper than os.path.join in these per-attribute paths.
+    item_path = "{}/{}".format(model_directory, stream_data["filename"])
+    with open_readonly_tarball_file(tar_file, item_path, members_by_name=members_by_name) as fi:
+        return BytesIO(fi.read())
+
+
+def _deserialize_item_from_stream(
+    stream: BytesIO, stream_data: dict, serializer_by_name: dict = None
+) -> Any:
+    """Verify and deserialize a single item from an in-memory stream."""
+    if serializer_by_name is not None:
+        serializer = serializer_by_name[stream_data["serializer"]]
+    else:
+        serializer = REGISTRY.get_serializer_by_name(stream_data["serializer"])
+    return serializer.from_verifiable_stream(
+        stream, stream_data["nonce"], stream_data["hmac_code"]
+    )
+
+
 def _load_item_from_tarfile_and_stream_data(
-    tar_file: TarFile, model_directory: str, stream_data: dict
+    tar_file: TarFile, model_directory: str, stream_data: dict, members_by_name: dict = None
 ) -> Any:
     """Load a single item from a tarfile and verify"""
-    logger.info("Loading file {}".format(stream_data["filename"]))
-    item_path = os.path.join(model_directory, stream_data["filename"])
-    serializer = REGISTRY.get_serializer_by_name(stream_data["serializer"])
-    with open_readonly_tarball_file(tar_file, item_path) as fi:
-        return serializer.from_verifiable_stream(fi, stream_data["nonce"], stream_data["hmac_code"])
+    stream = _read_item_stream_from_tarfile(
+        tar_file, model_directory, stream_data, members_by_name=members_by_name
+    )
+    return _deserialize_item_from_stream(stream, stream_data)
 
 
 def _check_and_raise_for_missing_or_null_serializer(needed_serializers: Set) -> None:
@@ -126,15 +203,16 @@ def _check_and_warn_for_missing_installed_packages(metadata: metadata_type) -> N
     installed_packages = metadata.get(METADATA_KEY_INSTALLED_PACKAGES)
     if installed_packages is None:
         logger.warning(
-            "Metadata key {} not found in metadata. This is optional for now but "
+            "Metadata key %s not found in metadata. This is optional for now but "
             "will soon be required. Consider re-serializing your model with a later"
-            "version of the serialization package"
-            "".format(METADATA_KEY_INSTALLED_PACKAGES)
+            "version of the serialization package",
+            METADATA_KEY_INSTALLED_PACKAGES,
         )
     elif len(installed_packages) == 0:  # it's a list, we know that from validation
         logger.warning(
-            "Found empty list for metadata field {}. Consider installing `pip` so that "
-            "this information can be saved.".format(METADATA_KEY_INSTALLED_PACKAGES)
+            "Found empty list for metadata field %s. Consider installing `pip` so that "
+            "this information can be saved.",
+            METADATA_KEY_INSTALLED_PACKAGES,
         )
     else:
         pass
@@ -155,11 +233,17 @@ def _set_non_serializable_attributes_to_none(model_object: SerializableModel) ->
             setattr(model_object, attr_name, None)
 
 
-@validate(tar_file=TarFile, model_directory=filename_safe_string, metadata=metadata_format)
 def _parse_metadata_into_model(
-    tar_file: TarFile, model_directory: str, metadata: metadata_type
+    tar_file: TarFile,
+    model_directory: str,
+    metadata: metadata_type,
+    members_by_name: Optional[dict] = None,
 ) -> SerializableModel:
-    """Return the stored model configuration from the stored metadata."""
+    """Return the stored model configuration from the stored metadata.
+
+    The metadata must already have been validated against `metadata_format`; this happens
+    in `load_from_tarfile` right after the metadata is parsed from its verified bytes.
+    """
     needed_serializers = {
         stream_data["serializer"]
         for stream_data in metadata["attributes"].values()
@@ -168,12 +252,68 @@ def _parse_metadata_into_model(
     _check_and_raise_for_missing_or_null_serializer(needed_serializers)
     _check_and_warn_for_missing_installed_packages(metadata)
 
-    attributes = {
-        attr_name: _load_item_from_tarfile_and_stream_data(tar_file, model_directory, stream_data)
-        for attr_name, stream_data in metadata["attributes"].items()
+    # Resolve each needed serializer once, instead of hitting the registry per attribute.
+    # This also keeps the worker threads below from touching the registry at all.
+    serializer_by_name = {
+        name: REGISTRY.get_serializer_by_name(name) for name in needed_serializers
     }
+
+    # Index the tarball members once (unless the caller already did), so that per-attribute
+    # loads don't each rescan the full member list.
+    if members_by_name is None:
+        members_by_name = get_tarball_members_by_name(tar_file)
+
+    # Read attributes in the order their members appear in the archive, rather than in
+    # metadata-dict order. This keeps reads sequential (no seeking backwards through the
+    # tarball per attribute), which matters for large models and for compressed archives.
+    # Members missing from the tarball sort first and fail promptly when opened.
+    def _member_offset(stream_data: dict) -> int:
+        member = members_by_name.get("{}/{}".format(model_directory, stream_data["filename"]))
+        return member.offset if member is not None else -1
+
+    ordered_attribute_items = sorted(
+        metadata["attributes"].items(), key=lambda item: _member_offset(item[1])
+    )
+
+    # TarFile objects are not thread-safe, so extract each attribute's bytes on this
+    # thread and fan the CPU-bound HMAC verification and deserialization out to the
+    # shared pool. Each stream is submitted as it is read off the tar, and once the pool
+    # is saturated the oldest result is collected before reading another: this caps the
+    # number of raw serialized copies alive at once at roughly the worker count, instead
+    # of buffering every attribute's bytes up front.
+    attributes = {}
+    if len(ordered_attribute_items) <= 1:
+        for attr_name, stream_data in ordered_attribute_items:
+            stream = _read_item_stream_from_tarfile(
+                tar_file, model_directory, stream_data, members_by_name=members_by_name
+            )
+            attributes[attr_name] = _deserialize_item_from_stream(
+                stream, stream_data, serializer_by_name=serializer_by_name
+            )
+    else:
+        pool = _get_serialization_pool()
+        in_flight = deque()
+        for attr_name, stream_data in ordered_attribute_items:
+            if len(in_flight) >= _SERIALIZATION_POOL_MAX_WORKERS:
+                done_name, done_future = in_flight.popleft()
+                attributes[done_name] = done_future.result()
+            in_flight.append(
+                (
+                    attr_name,
+                    pool.submit(
+                        _deserialize_item_from_stream,
+                        _read_item_stream_from_tarfile(
+                            tar_file, model_directory, stream_data, members_by_name=members_by_name
+                        ),
+                        stream_data,
+                        serializer_by_name=serializer_by_name,
+                    ),
+                )
+            )
+        for done_name, done_future in in_flight:
+            attributes[done_name] = done_future.result()
     model_object = _load_item_from_tarfile_and_stream_data(
-        tar_file, model_directory, metadata[METADATA_KEY_MODEL]
+        tar_file, model_directory, metadata[METADATA_KEY_MODEL], members_by_name=members_by_name
     )
 
     _set_non_serializable_attributes_to_none(model_object)
@@ -200,15 +340,6 @@ def _parse_metadata_into_model(
     return model_object
 
 
-@validate(
-    tar_file=TarFile,
-    model_directory=filename_safe_string,
-    attribute_name_to_stream_data=attribute_descriptor,
-    model_stream_data=All(),
-    gpg_home_dir=NON_EMPTY_STRING,  # has folder structure in it so not filename_safe_string
-    signing_key_fingerprint=NON_EMPTY_STRING,
-    passphrase=NON_EMPTY_STRING,
-)
 def _write_metadata_into_tarball(
     tar_file: TarFile,
     model_directory: str,
@@ -218,39 +349,51 @@ def _write_metadata_into_tarball(
     signing_key_fingerprint: str,
     passphrase: str,
 ) -> None:
-    """Write the metadata file entry into the model tarball."""
-    metadata_path = os.path.join(model_directory, METADATA_FILENAME)
+    """Write the metadata file entry into the model tarball.
+
+    All inputs here are produced by other code in this module; the assembled metadata can
+    optionally be re-checked against `metadata_format` before signing by setting
+    VALIDATE_METADATA_ON_WRITE_ENV_VAR.
+    """
+    metadata_path = "{}/{}".format(model_directory, METADATA_FILENAME)
     metadata = {
         "version": METADATA_FORMAT_VERSION,
         "model": model_stream_data,
         "attributes": attribute_name_to_stream_data,
-        "written_on_date": datetime.utcnow().isoformat(),
+        "written_on_date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
         "serializing_package_version": package_version,
         "installed_packages": get_installed_packages(),
     }
-    try:
-        metadata_format(metadata)
-    except Invalid as e:
-        raise SerializationError(
-            "Attempting to serialize metadata into the wrong format. {}".format(e.args)
-        )
+    if os.environ.get(VALIDATE_METADATA_ON_WRITE_ENV_VAR):
+        try:
+            metadata_format(metadata)
+        except Invalid as e:
+            raise SerializationError(
+                "Attempting to serialize metadata into the wrong format. {}".format(e.args)
+            )
 
-    meta_string_with_newline = json.dumps(metadata) + "\n"
+    # Compact separators: the metadata is machine-read only, and the installed-packages list
+    # alone can run to thousands of strings, so skip the default ", "/": " padding.
+    meta_string_with_newline = json.dumps(metadata, separators=(",", ":")) + "\n"
     signed_meta = sign_message(
         gpg_home_dir, signing_key_fingerprint, meta_string_with_newline.encode("utf-8"), passphrase
     )
-    stream = BytesIO(signed_meta)
-    consume_stream_into_tarball(tar_file, metadata_path, stream)
+    # signed_meta is already fully materialized bytes, so skip the stream seek/tell dance.
+    write_bytes_into_tarball(tar_file, metadata_path, signed_meta)
 
 
 def _write_model_into_tarball_and_get_stream_data(
     tar_file: TarFile, model_directory: str, naked_model: SerializableModel
 ) -> stream_type:
-    """Write the actual model class into a tarball"""
-    _ensure_model_is_naked(naked_model)
+    """Write the actual model class into a tarball.
+
+    The caller is responsible for the model being naked (all custom-serialized attributes
+    replaced with CustomSerializedValue placeholders); in the save path this is guaranteed
+    by construction, since _serialize_attributes_to_tarfile nulls every attribute it visits.
+    """
     model_serializer = REGISTRY.get_serializer_by_name(MODEL_SELF_SERIALIZER)
     stream, nonce, hmac_code = model_serializer.to_verifiable_stream(naked_model)
-    model_path = os.path.join(model_directory, MODEL_FILE_NAME)
+    model_path = "{}/{}".format(model_directory, MODEL_FILE_NAME)
     consume_stream_into_tarball(tar_file, model_path, stream)
     model_stream_data = {
         "nonce": nonce,
@@ -261,21 +404,12 @@ def _write_model_into_tarball_and_get_stream_data(
     return model_stream_data
 
 
-def _ensure_model_is_naked(model: SerializableModel) -> None:
-    """Ensure that all the attributes in a model have been nulled out"""
-    for attr_name in model.custom_serialization:
-        if not isinstance(getattr(model, attr_name), CustomSerializedValue):
-            raise AssertionError(
-                "Model has unserialized attribute {}, value: {}".format(
-                    attr_name, getattr(model, attr_name)
-                )
-            )
-
-
 def _serialize_attributes_to_tarfile(tar_file, model, model_directory) -> Dict[str, stream_type]:
     """Write the serializable attributes of a model to a tarfile"""
     serialization_scheme = model.custom_serialization
     attribute_name_to_stream_data = {}
+    serializer_by_name = {}
+    items_to_serialize = []
     for attr_name, attr_serializer in serialization_scheme.items():
         if attr_serializer == ATTRIBUTE_DO_NOT_SERIALIZE:
             setattr(model, attr_name, CustomSerializedValue())
@@ -287,8 +421,11 @@ def _serialize_attributes_to_tarfile(tar_file, model, model_directory) -> Dict[s
                 "model filename. The model can therefore not be "
                 "serialized.".format(attr_name, filename)
             )
-        # we have already checked that the serializer exists
-        serializer = REGISTRY.get_serializer_by_name(serializer_name)
+        # we have already checked that the serializer exists; resolve each name only once
+        serializer = serializer_by_name.get(serializer_name)
+        if serializer is None:
+            serializer = REGISTRY.get_serializer_by_name(serializer_name)
+            serializer_by_name[serializer_name] = serializer
         attribute = getattr(model, attr_name)
         if isinstance(attribute, CustomSerializedValue):
             raise AssertionError(
@@ -296,16 +433,25 @@ def _serialize_attributes_to_tarfile(tar_file, model, model_directory) -> Dict[s
                 "CustomSerializedValue. The model has likely already been "
                 "serialized, and repeating this will not work.".format(attr_name)
             )
-        stream, nonce, hmac_code = serializer.to_verifiable_stream(getattr(model, attr_name))
+        items_to_serialize.append((attr_name, serializer_name, filename, serializer, attribute))
         setattr(model, attr_name, CustomSerializedValue())
 
+    # Serializing each attribute (pickling plus HMAC) is independent CPU-bound work, so fan
+    # it out to a thread pool. The tarball itself is only written from this thread, since
+    # TarFile objects are not thread-safe.
+    serialized_streams = _map_possibly_in_parallel(
+        lambda item: item[3].to_verifiable_stream(item[4]), items_to_serialize
+    )
+    for (attr_name, serializer_name, filename, _, _), (stream, nonce, hmac_code) in zip(
+        items_to_serialize, serialized_streams
+    ):
         attribute_name_to_stream_data[attr_name] = {
             "nonce": nonce,
             "filename": filename,
             "hmac_code": hmac_code,
             "serializer": serializer_name,
         }
-        file_member_path = os.path.join(model_directory, filename)
+        file_member_path = "{}/{}".format(model_directory, filename)
         consume_stream_into_tarball(tar_file, file_member_path, stream)
     return attribute_name_to_stream_data
 
@@ -320,7 +466,10 @@ METADATA_FORMAT_VERSION = 3
 
 @validate(tar_file=TarFile, gpg_home_dir=voluptuous.Any(None, str))
 def load_from_tarfile(
-    tar_file: TarFile, gpg_home_dir: Optional[str] = None, **kwargs
+    tar_file: TarFile,
+    gpg_home_dir: Optional[str] = None,
+    members_by_name: Optional[dict] = None,
+    **kwargs
 ) -> SerializableModel:
     """Load a model configuration from a TarFile object.
 
@@ -329,6 +478,9 @@ def load_from_tarfile(
         gpg_home_dir: home directory for gpg to verify models
                   ***This argument is not optional!*** It is accepted as a kwarg to maintain
                   function signature consistency across different metadata format deserializers.
+        members_by_name: optional dict of member name -> TarInfo, as produced by
+                  get_tarball_members_by_name(), reused for all member lookups instead of
+                  rescanning the tarball index
         **kwargs: unused, accepted for function signature consistency across metadata formats
 
     Returns:
@@ -338,17 +490,23 @@ def load_from_tarfile(
         SerializationError, if the tar_file is not a valid model file.
         IntegrityError, if the serialized model fails integrity checks.
     """
-    model_directory = get_model_directory_name(tar_file)
+    if members_by_name is None:
+        members_by_name = get_tarball_members_by_name(tar_file)
+    model_directory = get_model_directory_name(tar_file, members_by_name=members_by_name)
 
-    metadata_path = os.path.join(model_directory, METADATA_FILENAME)
-    with open_readonly_tarball_file(tar_file, metadata_path) as f:
+    metadata_path = "{}/{}".format(model_directory, METADATA_FILENAME)
+    with open_readonly_tarball_file(tar_file, metadata_path, members_by_name=members_by_name) as f:
         verified_metadata_bytes = verify_and_extract_message(gpg_home_dir, f.read())
 
     logger.info("Metadata verified correctly. Json loading metadata")
-    metadata = json.loads(verified_metadata_bytes.decode("utf-8"))
+    # Validate the untrusted metadata exactly once, here at the trust boundary. The private
+    # helpers below rely on this and do not re-walk the schema.
+    metadata = metadata_format(json.loads(verified_metadata_bytes.decode("utf-8")))
 
     logger.info("Metadata json loaded correctly... Parsing metadata into model")
-    return _parse_metadata_into_model(tar_file, model_directory, metadata)
+    return _parse_metadata_into_model(
+        tar_file, model_directory, metadata, members_by_name=members_by_name
+    )
 
 
 @validate(
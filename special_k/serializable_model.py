@@ -12,6 +12,23 @@ from .utils import NON_EMPTY_STRING, filename_safe_string
 
 logger = logging.getLogger(__name__)
 
+# Compiled custom-serialization validators, keyed on the frozenset of serializer names they
+# were built for. Building the voluptuous schemas is not free, and models are often
+# instantiated in bulk; keying on the registry contents keeps the cache correct even when
+# new serializers are registered between instantiations.
+_custom_serialization_validator_cache = {}
+
+
+def _get_custom_serialization_validator(available_serializers):
+    """Get a validator for the custom_serialization property, compiled once per registry state."""
+    validator = _custom_serialization_validator_cache.get(available_serializers)
+    if validator is None:
+        nontrivial_serializer = Schema((Any(*available_serializers), filename_safe_string))
+        serializer_validator = Any(nontrivial_serializer, (None, None))
+        validator = Schema({NON_EMPTY_STRING: serializer_validator})
+        _custom_serialization_validator_cache[available_serializers] = validator
+    return validator
+
 
 class CustomSerializedValue(object):
     """Placeholder object for values that are saved using custom serialization.
@@ -31,6 +48,9 @@ class CustomSerializedValue(object):
       the placeholders with the real data.
     """
 
+    # Placeholders carry no state, so skip the per-instance __dict__.
+    __slots__ = ()
+
 
 class SerializableModel(model_interface.ModelInterface, metaclass=ABCMeta):
     def __init__(self):
@@ -39,13 +59,15 @@ class SerializableModel(model_interface.ModelInterface, metaclass=ABCMeta):
 
         # Verify that the custom serialization for the model is correct. This is done here to make
         # sure that you cannot instantiate a bad serializable model
-        # The validator `custom_serialization_validator` is made here and not as a global constant
-        # to make the code not care about when new serializers are registered with the registry.
+        # The validator is looked up here and not stored as a global constant to make the code
+        # not care about when new serializers are registered with the registry: the cache is
+        # keyed on the registry's current contents, so registering a serializer simply compiles
+        # a new validator.
         # WARNING: it is possible to screw yourself by making a serializable model, and then
         # messing with the REGISTRY.
-        nontrivial_serializer = Schema((Any(*REGISTRY.available_serializers), filename_safe_string))
-        serializer_validator = Any(nontrivial_serializer, (None, None))
-        custom_serialization_validator = Schema({NON_EMPTY_STRING: serializer_validator})
+        custom_serialization_validator = _get_custom_serialization_validator(
+            REGISTRY.available_serializers
+        )
         custom_serialization_validator(self.custom_serialization)
 
     @property
@@ -1,8 +1,6 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """All of the ways we know how to write and read things"""
-import codecs
 from collections import OrderedDict
-from io import BytesIO
 import json
 import logging
 import pickle
@@ -11,12 +9,13 @@ from typing import Any, Dict, NamedTuple
 import dill
 import joblib
 import msgpack
-from voluptuous import Optional, Schema, validate
 
 from .base import PATH_TYPE, BaseIO
 from .utils import (
     STREAM_TYPE,
     deserialize_from_temp_h5py,
+    get_temp_h5py_file_image,
+    load_from_h5py_file_image,
     read_json_from_stream,
     serialize_to_temp_h5py,
     write_json_to_stream,
@@ -25,6 +24,12 @@ from .utils import (
 
 logger = logging.getLogger(__name__)
 
+# Pickle protocol 5 (available in python 3.8+) serializes large binary buffers such as numpy
+# arrays with far less copying than the older default protocol. Fall back to the highest
+# protocol the interpreter supports on older pythons. Loading is unaffected: pickle detects
+# the protocol from the stream.
+PICKLE_PROTOCOL = min(pickle.HIGHEST_PROTOCOL, 5)
+
 
 class JsonIO(BaseIO):
     @staticmethod
@@ -40,31 +45,35 @@ class JsonIO(BaseIO):
     @staticmethod
     def dump(item: Any, filepath: PATH_TYPE) -> None:
         """Serialize to disk"""
-        with codecs.open(filepath, "w", encoding="utf-8") as fi:
+        with open(filepath, "w", encoding="utf-8") as fi:
             json.dump(item, fi)
 
     @staticmethod
     def load(filepath: PATH_TYPE) -> Any:
         """Deserialize from disk"""
-        with codecs.open(filepath, "r", encoding="utf-8") as fi:
+        with open(filepath, "r", encoding="utf-8") as fi:
             item = json.load(fi)
         return item
 
 
 class PickleIO(BaseIO):
-    _serialize_to_stream = staticmethod(pickle.dump)
+    @staticmethod
+    def _serialize_to_stream(item: Any, stream: STREAM_TYPE) -> None:
+        """Serialize to stream"""
+        pickle.dump(item, stream, protocol=PICKLE_PROTOCOL)
+
     _deserialize_from_stream = staticmethod(pickle.load)
 
     @staticmethod
     def dump(item: Any, filepath: PATH_TYPE) -> None:
         """Serialize to disk"""
-        with codecs.open(filepath, "wb") as fi:
-            pickle.dump(item, fi)
+        with open(filepath, "wb") as fi:
+            pickle.dump(item, fi, protocol=PICKLE_PROTOCOL)
 
     @staticmethod
     def load(filepath: PATH_TYPE) -> Any:
         """Deserialize from disk"""
-        with codecs.open(filepath, "rb") as fi:
+        with open(filepath, "rb") as fi:
             item = pickle.load(fi)
         return item
 
@@ -87,31 +96,35 @@ class MsgPackIO(BaseIO):
     @staticmethod
     def dump(item: Any, filepath: PATH_TYPE) -> None:
         """Serialize to disk"""
-        with codecs.open(filepath, "wb") as fi:
+        with open(filepath, "wb") as fi:
             msgpack.dump(item, fi, use_bin_type=True)
 
     @staticmethod
     def load(filepath: PATH_TYPE) -> Any:
         """Deserialize from disk"""
-        with codecs.open(filepath, "rb") as fi:
+        with open(filepath, "rb") as fi:
             item = msgpack.load(fi, raw=False)
         return item
 
 
 class DillIO(BaseIO):
-    _serialize_to_stream = staticmethod(dill.dump)
+    @staticmethod
+    def _serialize_to_stream(item: Any, stream: STREAM_TYPE) -> None:
+        """Serialize to stream"""
+        dill.dump(item, stream, protocol=PICKLE_PROTOCOL)
+
     _deserialize_from_stream = staticmethod(dill.load)
 
     @staticmethod
     def dump(item: Any, filepath: PATH_TYPE) -> None:
         """Serialize to disk"""
-        with codecs.open(filepath, "wb") as fi:
-            dill.dump(item, fi)
+        with open(filepath, "wb") as fi:
+            dill.dump(item, fi, protocol=PICKLE_PROTOCOL)
 
     @staticmethod
     def load(filepath: PATH_TYPE) -> Any:
         """Deserialize from disk"""
-        with codecs.open(filepath, "rb") as fi:
+        with open(filepath, "rb") as fi:
             item = dill.load(fi)
         return item
 
@@ -123,13 +136,13 @@ class JoblibIO(BaseIO):
     @staticmethod
     def dump(item: Any, filepath: PATH_TYPE) -> None:
         """Serialize to disk"""
-        with codecs.open(filepath, "wb") as fi:
+        with open(filepath, "wb") as fi:
             joblib.dump(item, fi)
 
     @staticmethod
     def load(filepath: PATH_TYPE) -> Any:
         """Deserialize from disk"""
-        with codecs.open(filepath, "rb") as fi:
+        with open(filepath, "rb") as fi:
             item = joblib.load(fi)
         return item
 
@@ -143,10 +156,6 @@ try:
         keras_model: keras.models.Model
         custom_objects: dict
 
-    KERAS_CUSTOM_SERIALIZED_FORMAT = Schema(
-        {"keras_model": bytes, "custom_objects": Optional(dict)}, required=True
-    )
-
     class KerasIO(BaseIO):
         @staticmethod
         def _serialize_to_stream(item: Any, stream: STREAM_TYPE) -> None:
@@ -195,23 +204,28 @@ try:
         def _partially_serialize(item: KerasCustomComponent) -> Dict[str, Any]:
             """Partially serialize a model (write the keras model to a string)"""
             KerasCustomObjectsIO._check_custom_objects(item)
-            bio = BytesIO()
-            serialize_to_temp_h5py(item.keras_model, bio, KerasIO.dump)
-            bio.seek(0)
+            # Take the h5 image directly instead of writing it into a throwaway BytesIO and
+            # immediately reading it back out, which held two full copies of the model image.
             partially_serialized = {
-                "keras_model": bio.read(),
+                "keras_model": get_temp_h5py_file_image(item.keras_model, KerasIO.dump),
                 "custom_objects": item.custom_objects,
             }
             return partially_serialized
 
         @staticmethod
-        @validate(item=KERAS_CUSTOM_SERIALIZED_FORMAT)
         def _complete_deserialization(item: Any) -> KerasCustomComponent:
             """Complete deserialization: load the keras model from a string with custom objects"""
-            stream_with_model_only = BytesIO(item["keras_model"])
+            # Check the trivial shape directly instead of walking a voluptuous schema per call.
+            if not (isinstance(item, dict) and isinstance(item.get("keras_model"), bytes)):
+                raise TypeError(
+                    "Expected a dict with a bytes-valued 'keras_model' entry, "
+                    "found {}".format(type(item))
+                )
             custom_objects = item["custom_objects"]
-            model = deserialize_from_temp_h5py(
-                stream_with_model_only,
+            # The image is already bytes, so load it directly instead of wrapping it in a
+            # BytesIO just to have the stream helper read it back out.
+            model = load_from_h5py_file_image(
+                item["keras_model"],
                 lambda x: keras.models.load_model(x, custom_objects=custom_objects),
             )
             return KerasCustomComponent(model, custom_objects)
@@ -321,8 +335,8 @@ SERIALIZER_TORCH_STATE_DICT = "torch_state_dict"
 SERIALIZER_DILL = "dill"
 
 
-def get_base_serializer_map():
-    """Get the base serializer map."""
+def _make_base_serializer_map():
+    """Build the base serializer map from the serializers available at import time."""
     base_serializer_map = {
         SERIALIZER_PICKLE: PickleIO,
         SERIALIZER_MSGPACK: MsgPackIO,
@@ -339,3 +353,18 @@ def get_base_serializer_map():
             {SERIALIZER_TORCH_MODEL: TorchModelIO, SERIALIZER_TORCH_STATE_DICT: TorchStateDictIO}
         )
     return base_serializer_map
+
+
+# The set of base serializers is fixed once imports have resolved, so build the map exactly
+# once instead of re-deciding keras/torch availability on every call.
+_BASE_SERIALIZER_MAP = _make_base_serializer_map()
+
+
+def get_base_serializer_map():
+    """Get the base serializer map.
+
+    Returns a fresh copy on each call: SerializerRegistry mutates the mapping it is
+    constructed with, so handing out the shared dict would let registrations leak
+    between registries.
+    """
+    return dict(_BASE_SERIALIZER_MAP)
@@ -1,8 +1,7 @@
 # Copyright 2020-present Kensho Technologies, LLC.
+from collections import abc
 from typing import FrozenSet, Mapping, Type
 
-from voluptuous import Schema, validate
-
 from .base import BaseIO
 from .base_serializers import get_base_serializer_map
 
@@ -24,7 +23,10 @@ class SerializerRegistry:
 
     def _assert_valid_name_and_serializer(self, name: str, serializer) -> None:
         """Check whether name and serializer are valid to be added."""
-        if not isinstance(serializer(), BaseIO):
+        # Check the class itself rather than instantiating it: constructing a serializer just
+        # to probe inheritance can be arbitrarily expensive (e.g. backends that do heavy
+        # initialization) and has side effects.
+        if not (isinstance(serializer, type) and issubclass(serializer, BaseIO)):
             raise TypeError(
                 "Found serializer of type {}, expected `BaseIO`".format(type(serializer))
             )
@@ -42,9 +44,16 @@ class SerializerRegistry:
         self._assert_valid_name_and_serializer(name, serializer)
         self._serializer_map[name] = serializer
 
-    @validate(mapping_of_serializers=Schema({str: type}))
     def register_multiple_serializers(self, mapping_of_serializers: SERIALIZER_MAP_TYPE) -> None:
         """Register multiple serializers."""
+        # A direct type check beats walking a voluptuous schema here; the per-entry name and
+        # serializer validation below already covers the mapping's contents.
+        if not isinstance(mapping_of_serializers, abc.Mapping):
+            raise TypeError(
+                "Expected a mapping of names to serializers, found {}".format(
+                    type(mapping_of_serializers)
+                )
+            )
         # First check that all serializers in the mapping can be added
         # We check up front, because if they cannot and we repeatedly try to add them (ie if we add
         # them in an __init__ file), then after the first iteration the erroring serializer will not
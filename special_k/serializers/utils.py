@@ -1,12 +1,10 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-import codecs
 import contextlib
 import json
 import os
 import shutil
 import tempfile
 from typing import Any, Callable
-from uuid import uuid4
 
 import h5py
 
@@ -15,7 +13,8 @@ from .base import STREAM_TYPE
 
 def write_json_to_stream(item: Any, stream: STREAM_TYPE) -> int:  # stream.write returns an int
     """Write json to a stream with the right encoding"""
-    return stream.write(json.dumps(item).encode("utf-8"))
+    # Compact separators: the payload is machine-read only, so skip the default padding.
+    return stream.write(json.dumps(item, separators=(",", ":")).encode("utf-8"))
 
 
 def read_json_from_stream(stream: STREAM_TYPE) -> Any:
@@ -23,38 +22,55 @@ def read_json_from_stream(stream: STREAM_TYPE) -> Any:
     return json.loads(stream.read().decode("utf-8"))
 
 
-def serialize_to_temp_h5py(item: Any, stream: STREAM_TYPE, save_func: Callable) -> None:
-    """Serialize `item` to a stream
+def get_temp_h5py_file_image(item: Any, save_func: Callable) -> bytes:
+    """Serialize `item` through an in-memory h5py file and return the resulting file image.
 
-    This is a hack to avoid writing files to disk!
-    This will
-        create an h5py file in memory
-        write the contents of the h5py object into `stream`
+    This is a hack to avoid writing files to disk! Callers that need the image as bytes
+    (rather than written into a stream) should use this directly instead of round-tripping
+    through serialize_to_temp_h5py and an intermediate BytesIO.
 
     Args:
         item: item to serialize
-        stream: stream into which to serialize the object
         save_func: function to dump `item` to h5py
+
+    Returns:
+        bytes, the full h5 file image
     """
     fake_name = "fake name does not matter"
     with h5py.File(fake_name, driver="core", backing_store=False) as h5file:
         save_func(item, h5file)
         h5file.flush()
-        stream.write(h5file.fid.get_file_image())
-    if os.path.exists(fake_name):
+        file_image = h5file.fid.get_file_image()
+    # Sanity check only: skip the stat() under -O, it costs a syscall per serialize.
+    if __debug__ and os.path.exists(fake_name):
         raise AssertionError(
             "This should never happen. A fake file named {} was created "
             "in memory but buggy code accidentally wrote it to "
             "disk".format(fake_name)
         )
+    return file_image
+
+
+def serialize_to_temp_h5py(item: Any, stream: STREAM_TYPE, save_func: Callable) -> None:
+    """Serialize `item` to a stream
+
+    This is a hack to avoid writing files to disk!
+    This will
+        create an h5py file in memory
+        write the contents of the h5py object into `stream`
+
+    Args:
+        item: item to serialize
+        stream: stream into which to serialize the object
+        save_func: function to dump `item` to h5py
+    """
+    stream.write(get_temp_h5py_file_image(item, save_func))
 
 
 def deserialize_from_temp_h5py(stream: STREAM_TYPE, load_func: Callable) -> Any:
     """Deserialize from a stream
 
     This is a hack to avoid writing files to disk!
-    A fake h5py file is created and all of the attributes are manually set to correct values.
-    Change this code with great care!!
 
     Args:
         stream: a stream-like object from which to read an object
@@ -63,9 +79,29 @@ def deserialize_from_temp_h5py(stream: STREAM_TYPE, load_func: Callable) -> Any:
     Returns:
         Whatever was serialized as an h5py file to `stream`.
     """
+    return load_from_h5py_file_image(stream.read(), load_func)
+
+
+def load_from_h5py_file_image(file_image: bytes, load_func: Callable) -> Any:
+    """Deserialize from an h5 file image held in memory.
+
+    This is a hack to avoid writing files to disk!
+    A fake h5py file is created and all of the attributes are manually set to correct values.
+    Change this code with great care!!
+
+    Callers that already hold the image as bytes should use this directly rather than
+    wrapping the bytes in a stream just for deserialize_from_temp_h5py to read them back out.
+
+    Args:
+        file_image: bytes, the full h5 file image
+        load_func: function to load `item` from h5py
+
+    Returns:
+        Whatever was serialized as an h5py file into `file_image`.
+    """
     file_access_property_list = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
     file_access_property_list.set_fapl_core(backing_store=False)
-    file_access_property_list.set_file_image(stream.read())
+    file_access_property_list.set_file_image(file_image)
 
     file_id_args = {
         "fapl": file_access_property_list,
@@ -77,7 +113,8 @@ def deserialize_from_temp_h5py(stream: STREAM_TYPE, load_func: Callable) -> Any:
 
     with contextlib.closing(h5py.h5f.open(**file_id_args)) as file_id:
         with h5py.File(file_id, **h5_file_args) as h5_file:
-            if os.path.exists(file_id_args["name"]):
+            # Sanity check only: skip the stat() under -O, it costs a syscall per deserialize.
+            if __debug__ and os.path.exists(file_id_args["name"]):
                 raise AssertionError(
                     "Buggy code- this should never happen. "
                     "File {} was written to disk even though you "
@@ -99,8 +136,9 @@ def serialize_to_temp_file(item: Any, stream: STREAM_TYPE, save_func: Callable)
     temp_dir = tempfile.mkdtemp()
 
     try:
-        temp_file_name = str(uuid4()).replace("-", "")
-        absolute_file_path = os.path.join(temp_dir, temp_file_name)
+        # The directory is freshly made and private, so any fixed name is collision-free;
+        # no need to pay for a uuid4 (a getrandom syscall plus formatting) per call.
+        absolute_file_path = os.path.join(temp_dir, "payload")
         save_func(item, absolute_file_path)
 
         # While we wrote the file to disk and closed it, the file system does not necessarily
@@ -110,13 +148,10 @@ def serialize_to_temp_file(item: Any, stream: STREAM_TYPE, save_func: Callable)
         os.fsync(dirfd)
         os.close(dirfd)
 
-        # Now we can open and read the file into the stream.
-        with codecs.open(absolute_file_path, "rb") as f:
-            while True:
-                buf = f.read(4096)
-                if not buf:
-                    break
-                stream.write(buf)
+        # Now we can open and read the file into the stream. Copy with a 1 MiB buffer
+        # instead of a hand-rolled 4 KiB loop: far fewer syscalls and python iterations.
+        with open(absolute_file_path, "rb") as f:
+            shutil.copyfileobj(f, stream, length=1 << 20)
     finally:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
@@ -136,26 +171,15 @@ def deserialize_from_temp_file(stream: STREAM_TYPE, load_func: Callable) -> Any:
     temp_dir = tempfile.mkdtemp()
 
     try:
-        temp_file_name = str(uuid4()).replace("-", "")
-        absolute_file_path = os.path.join(temp_dir, temp_file_name)
-
-        with codecs.open(absolute_file_path, "wb") as f:
-            while True:
-                buf = stream.read(4096)
-                if not buf:
-                    break
-                f.write(buf)
+        # The directory is freshly made and private, so any fixed name is collision-free.
+        absolute_file_path = os.path.join(temp_dir, "payload")
 
-            # Ensure the file's data is actually saved and visible.
-            f.flush()
-            os.fsync(f.fileno())
+        with open(absolute_file_path, "wb") as f:
+            shutil.copyfileobj(stream, f, length=1 << 20)
 
-        # While we wrote the file to disk and closed it, the file system does not necessarily
-        # guarantee that the file is already visible within its directory. For this guarantee,
-        # we have to open and fsync the directory before attempting to open the file itself.
-        dirfd = os.open(temp_dir, os.O_DIRECTORY)
-        os.fsync(dirfd)
-        os.close(dirfd)
+        # No fsync here: the file only exists to be read straight back by load_func in this
+        # same process (closing the file makes the data visible to it), and the directory is
+        # deleted in the finally block, so durability across a crash buys nothing.
 
         # read file with `load_func` and return it
         return load_func(absolute_file_path)
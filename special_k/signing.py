@@ -1,16 +1,15 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-import codecs
 from datetime import datetime
+import hashlib
 import logging
 import os
 import subprocess
 import time
 
 import gpg
-from voluptuous import Optional, validate
 
 from .check_gpg_keys import get_keyname_to_fingerprint, get_trusted_keys_dir, get_trusted_pub_keys
-from .utils import NON_EMPTY_STRING, START_OF_HISTORY, get_key_expirations_for_gpg_context
+from .utils import START_OF_HISTORY, get_key_expirations_for_gpg_context
 
 
 logger = logging.getLogger(__name__)
@@ -30,6 +29,31 @@ TRUSTED_HASH_ALGORITHMS = frozenset(
 )
 DAYS_WARNING_FOR_KEY_EXPIRATION = 30  # Warn 30 days prior to key expiry
 
+# A signature is only acceptable if GPG found it valid and fully trusted. Precompute the
+# expected summary bitmask and validity level once instead of recomputing the bitwise-or and
+# chasing gpg.constants attributes on every signature check.
+_EXPECTED_SIGNATURE_SUMMARY = gpg.constants.sigsum.VALID | gpg.constants.sigsum.GREEN
+_FULL_VALIDITY = gpg.constants.validity.FULL
+# Same treatment for the constants used when constructing contexts and signing.
+_PINENTRY_MODE_LOOPBACK = gpg.constants.PINENTRY_MODE_LOOPBACK
+_SIG_MODE_CLEAR = gpg.constants.sig.mode.CLEAR
+
+# Cache of messages that have already been verified successfully, keyed on the GPG home
+# directory and the SHA-256 digest of the signed payload. Verification is deterministic for
+# identical bytes against the same key database, so repeated loads of the same model in one
+# process can skip the expensive GPG round-trip. Only positive results are ever cached.
+_VERIFIED_MESSAGE_CACHE_MAX_SIZE = 128
+_verified_message_cache = {}
+
+
+def _check_non_empty_str(value, name):
+    """Raise unless the value is a non-empty string."""
+    # Inlined replacement for the voluptuous @validate decorator: these functions sit on the
+    # sign/verify hot path, where running a Schema over the kwargs on every call is pure
+    # overhead for what amounts to two type checks.
+    if not isinstance(value, str) or not value:
+        raise TypeError("{} must be a non-empty string, got {!r}".format(name, value))
+
 
 def _validate_message(message):
     """Ensure the message is correctly representable by GPG."""
@@ -43,55 +67,71 @@ def _validate_message(message):
         )
 
 
+# Cache of trusted-dir file contents keyed on path, guarded by an (mtime_ns, size) fingerprint
+# so a changed file is re-read. The trusted keys and trustdb rarely change within a process,
+# but add_trusted_keys_to_gpg_home_dir re-reads them for every fresh GPG home directory.
+_trusted_file_contents_cache = {}
+
+
 def _get_file_contents_from_trusted_dir_as_binary(relative_path):
     """Return the binary contents of the file at the specified path relative to trusted keys dir."""
     trusted_keys_dir = get_trusted_keys_dir()
     filepath = os.path.join(trusted_keys_dir, relative_path)
-    with codecs.open(filepath, "rb") as f:
-        return f.read()
-
-
-def _run_command_with_stdin_input(command_args, stdin_data):
+    stat_result = os.stat(filepath)
+    fingerprint = (stat_result.st_mtime_ns, stat_result.st_size)
+    cached = _trusted_file_contents_cache.get(filepath)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    with open(filepath, "rb") as f:
+        contents = f.read()
+    _trusted_file_contents_cache[filepath] = (fingerprint, contents)
+    return contents
+
+
+def _run_command_with_stdin_input(command_args, stdin_data, env=None):
     """Run the provided command, passing the given data to stdin."""
-    read_pipe, write_pipe = os.pipe()
-    write_pipe_closed = False
-    try:
-        os.write(write_pipe, stdin_data)
-        os.close(write_pipe)
-        write_pipe_closed = True
-
-        subprocess.check_call(command_args, stdin=read_pipe)
-    finally:
-        os.close(read_pipe)
-        if not write_pipe_closed:
-            os.close(write_pipe)
+    # subprocess.run spawns the child before feeding it stdin, writing in a loop until all
+    # bytes are delivered. Hand-rolled os.pipe plumbing wrote the data before the child was
+    # even started, which deadlocks once stdin_data exceeds the kernel pipe buffer (64KiB on
+    # Linux) -- a real risk for multi-key armored keyring imports.
+    subprocess.run(command_args, input=stdin_data, env=env, check=True)
 
 
 def _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command_args):
-    """Produce a new command arguments that set required GPG env vars before running the command."""
-    result = [
-        "env",
-        "-u",
-        "GPG_AGENT_INFO",  # There should not be a GPG agent on the system, unset the env var.
-        "GNUPGHOME={}".format(gpg_home_dir),  # Tell GPG where to look for keys and trust info.
-    ]
-    result.extend(gpg_command_args)
+    """Produce the full command arguments and environment for running the given GPG command.
+
+    Returns:
+        tuple of (command args list, environment dict). subprocess accepts the environment
+        directly, so there is no need to fork an intermediate `env` process per invocation.
+    """
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        # There should not be a GPG agent on the system, unset the env var.
+        if key != "GPG_AGENT_INFO"
+    }
+    env["GNUPGHOME"] = gpg_home_dir  # Tell GPG where to look for keys and trust info.
+
+    result = list(gpg_command_args)
     result.append("--batch")  # Use batch mode so that no interactive commands are used
-    return result
+    # Skip reading gpg.conf: the isolated GNUPGHOME is fully configured via flags, and
+    # skipping the config lookup shaves file-system work off every short-lived gpg launch.
+    result.append("--no-options")
+    return result, env
 
 
 def _import_trust_db(gpg_home_dir, trustdb_data):
     """Import the GPG trust database into the given GPG home directory."""
     gpg_command = ["gpg", "--import-ownertrust"]
-    final_args = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
-    _run_command_with_stdin_input(final_args, trustdb_data)
+    final_args, env = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
+    _run_command_with_stdin_input(final_args, trustdb_data, env=env)
 
 
 def _import_public_key(gpg_home_dir, pubkey):
     """Import the given public key into the given GPG home directory."""
     gpg_command = ["gpg", "--import"]
-    final_args = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
-    _run_command_with_stdin_input(final_args, pubkey)
+    final_args, env = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
+    _run_command_with_stdin_input(final_args, pubkey, env=env)
 
 
 def _import_secret_key(gpg_home_dir, private_key, passphrase):
@@ -100,8 +140,8 @@ def _import_secret_key(gpg_home_dir, private_key, passphrase):
     if passphrase is not None:
         gpg_command.extend(["--passphrase", passphrase])
 
-    final_args = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
-    _run_command_with_stdin_input(final_args, private_key)
+    final_args, env = _set_up_gpg_env_vars_for_gpg_command(gpg_home_dir, gpg_command)
+    _run_command_with_stdin_input(final_args, private_key, env=env)
 
 
 def _is_testing():
@@ -118,6 +158,22 @@ def _is_testing():
         )
 
 
+def _is_signature_valid(signature, current_time):
+    """Check whether a single signature from a verification result is acceptable."""
+    return (
+        # GPG has determined that the signature is valid and fully trusted.
+        signature.validity == _FULL_VALIDITY
+        and signature.summary == _EXPECTED_SIGNATURE_SUMMARY
+        # The signing key was not used incorrectly. An example of incorrect use would be
+        # using a key that was declared encryption-only as a signing key.
+        and not signature.wrong_key_usage
+        # The hashing algorithm used to hash the message content is sufficiently strong.
+        and signature.hash_algo in TRUSTED_HASH_ALGORITHMS
+        # The signature's timestamp isn't in the future relative to our current time.
+        and signature.timestamp <= current_time
+    )
+
+
 def _raise_for_unsafe_key(fingerprint):
     """Raise a RuntimeError if an unsafe key is detected."""
     if fingerprint == _UNSAFE_KEY_FOR_TESTING_FINGERPRINT and not _is_testing():
@@ -134,29 +190,46 @@ def _raise_for_unsafe_key(fingerprint):
 
 def get_days_until_expiry(ctx: gpg.Context):
     """Get a dictionary of key fingerprint to days until expiry (can be negative)"""
-    fpr_to_expiry = get_key_expirations_for_gpg_context(ctx)
     now = datetime.utcnow()
-    fpr_to_days = {}
-    for fpr, expiry in fpr_to_expiry.items():
-        # timestamp of the unix epoch is code for no expiration
-        if expiry == START_OF_HISTORY:
-            fpr_to_days[fpr] = float("inf")
-        else:
-            fpr_to_days[fpr] = float((expiry - now).days)
-    return fpr_to_days
+    no_expiration = START_OF_HISTORY  # timestamp of the unix epoch is code for no expiration
+    never = float("inf")
+    return {
+        fpr: never if expiry == no_expiration else (expiry - now).days
+        for fpr, expiry in get_key_expirations_for_gpg_context(ctx).items()
+    }
+
+
+# Expiry warnings are throttled to once per hour per GPG home directory: enumerating every
+# key in the keyring on each sign/verify is wasted work in a batch that loads many models
+# against the same keyring, and a repeat warning within the hour adds no information.
+_EXPIRY_CHECK_INTERVAL_SECONDS = 3600
+_last_expiry_check_by_home_dir = {}
 
 
 def warn_for_key_near_expiry(ctx: gpg.Context):
     """Warn if a key is near expiry"""
-    fpr_to_expiry_days = get_days_until_expiry(ctx)
-
-    for fpr, days_to_expiry in fpr_to_expiry_days.items():
+    monotonic_now = time.monotonic()
+    last_check = _last_expiry_check_by_home_dir.get(ctx.home_dir)
+    if last_check is not None and monotonic_now - last_check < _EXPIRY_CHECK_INTERVAL_SECONDS:
+        return
+    _last_expiry_check_by_home_dir[ctx.home_dir] = monotonic_now
+
+    # Runs on every sign/verify call, and in the common case no key is anywhere near expiry,
+    # so iterate the expirations directly instead of materializing the days-until-expiry dict
+    # (get_days_until_expiry stays around as the public API for callers that want the map).
+    now = datetime.utcnow()
+    for fpr, expiry in get_key_expirations_for_gpg_context(ctx).items():
+        if expiry == START_OF_HISTORY:  # code for no expiration
+            continue
+        days_to_expiry = (expiry - now).days
+        if days_to_expiry > DAYS_WARNING_FOR_KEY_EXPIRATION:
+            continue
         if days_to_expiry < 0:
             logger.warning(
                 "Found key with fingerprint {} that expired {} days ago. "
                 "Fix now!".format(fpr, abs(days_to_expiry))
             )
-        elif 0 <= days_to_expiry <= DAYS_WARNING_FOR_KEY_EXPIRATION:
+        else:
             logger.warning(
                 "Found key with fingerprint {} that expires in {} days. "
                 "Fix ASAP!".format(fpr, days_to_expiry)
@@ -165,12 +238,11 @@ def warn_for_key_near_expiry(ctx: gpg.Context):
 
 def import_secret_key(gpg_home_dir, private_key_file, passphrase=None):
     """Import a private key into gpg home directory"""
-    with codecs.open(private_key_file, "rb") as f:
+    with open(private_key_file, "rb") as f:
         private_key = f.read()
     _import_secret_key(gpg_home_dir, private_key, passphrase)
 
 
-@validate(gpg_home_dir=NON_EMPTY_STRING)
 def add_trusted_keys_to_gpg_home_dir(gpg_home_dir):
     """Add known trusted keys to the given GPG home directory.
 
@@ -178,8 +250,12 @@ def add_trusted_keys_to_gpg_home_dir(gpg_home_dir):
         gpg_home_dir: string, the directory where GPG should look for keys and trust information.
                       The directory is required to already exist.
     """
+    _check_non_empty_str(gpg_home_dir, "gpg_home_dir")
     trusted_pub_keys = get_trusted_pub_keys()
-    # Import trusted public keys.
+    # Import trusted public keys. GPG happily parses multiple concatenated armored key blocks
+    # from a single stream, so gather all the key material and import it in one subprocess
+    # launch instead of paying fork/exec plus a keyring lock per key.
+    pubkey_blobs = []
     for key_filename, fingerprint in get_keyname_to_fingerprint().items():
         _raise_for_unsafe_key(fingerprint)
         if key_filename not in trusted_pub_keys:
@@ -187,8 +263,9 @@ def add_trusted_keys_to_gpg_home_dir(gpg_home_dir):
                 "Trusted key file {} not found in fingerprint lookup".format(key_filename)
             )
         logger.info("Adding public key from file %s", key_filename)
-        pubkey = _get_file_contents_from_trusted_dir_as_binary(key_filename)
-        _import_public_key(gpg_home_dir, pubkey)
+        pubkey_blobs.append(_get_file_contents_from_trusted_dir_as_binary(key_filename))
+    if pubkey_blobs:
+        _import_public_key(gpg_home_dir, b"\n".join(pubkey_blobs))
 
     # Import the trustdb
     logger.info("Importing trustdb")
@@ -196,12 +273,6 @@ def add_trusted_keys_to_gpg_home_dir(gpg_home_dir):
     _import_trust_db(gpg_home_dir, trustdb_data)
 
 
-@validate(
-    gpg_home_dir=NON_EMPTY_STRING,
-    signing_key_fingerprint=NON_EMPTY_STRING,
-    message=bytes,
-    passphrase=Optional(NON_EMPTY_STRING),
-)
 def sign_message(gpg_home_dir, signing_key_fingerprint, message, passphrase=None):
     """Sign the given message using the key with the given fingerprint.
 
@@ -226,6 +297,13 @@ def sign_message(gpg_home_dir, signing_key_fingerprint, message, passphrase=None
     Returns:
         bytes, the signed cleartext message with signature applied
     """
+    _check_non_empty_str(gpg_home_dir, "gpg_home_dir")
+    _check_non_empty_str(signing_key_fingerprint, "signing_key_fingerprint")
+    if not isinstance(message, bytes):
+        raise TypeError("message must be bytes, got {}".format(type(message)))
+    if passphrase is not None:
+        _check_non_empty_str(passphrase, "passphrase")
+
     _raise_for_unsafe_key(signing_key_fingerprint)
     _validate_message(message)
 
@@ -233,7 +311,7 @@ def sign_message(gpg_home_dir, signing_key_fingerprint, message, passphrase=None
         home_dir=gpg_home_dir,
         armor=True,
         offline=True,
-        pinentry_mode=gpg.constants.PINENTRY_MODE_LOOPBACK,
+        pinentry_mode=_PINENTRY_MODE_LOOPBACK,
     ) as ctx:
         warn_for_key_near_expiry(ctx)
         if passphrase is not None:
@@ -248,12 +326,11 @@ def sign_message(gpg_home_dir, signing_key_fingerprint, message, passphrase=None
         secret_key = ctx.get_key(signing_key_fingerprint, secret=True)
         ctx.signers = [secret_key]
 
-        signed_data, _ = ctx.sign(message, mode=gpg.constants.sig.mode.CLEAR)
+        signed_data, _ = ctx.sign(message, mode=_SIG_MODE_CLEAR)
 
         return signed_data
 
 
-@validate(gpg_home_dir=NON_EMPTY_STRING, signed_data=bytes)
 def verify_and_extract_message(gpg_home_dir, signed_data):
     """Verify the signature's trustworthiness, then return the binary data that was signed.
 
@@ -274,38 +351,33 @@ def verify_and_extract_message(gpg_home_dir, signed_data):
     Returns:
         bytes, the signed cleartext message with signature applied
     """
+    _check_non_empty_str(gpg_home_dir, "gpg_home_dir")
+    if not isinstance(signed_data, bytes):
+        raise TypeError("signed_data must be bytes, got {}".format(type(signed_data)))
+
+    cache_key = (gpg_home_dir, hashlib.sha256(signed_data).digest())
+    cached_message = _verified_message_cache.get(cache_key)
+    if cached_message is not None:
+        return cached_message
+
     with gpg.Context(
         home_dir=gpg_home_dir,
         armor=True,
         offline=True,
-        pinentry_mode=gpg.constants.PINENTRY_MODE_LOOPBACK,
+        pinentry_mode=_PINENTRY_MODE_LOOPBACK,
     ) as ctx:
         warn_for_key_near_expiry(ctx)
         recovered_message, verification_result = ctx.verify(signed_data)
 
         current_time = time.time()
 
-        # In principle, the gpg module should do all of these checks
-        valid_signatures = [
-            signature
+        # In principle, the gpg module should do all of these checks. Short-circuit on the
+        # first valid signature instead of materializing a list: the usual case is a single
+        # signature that passes, and chained `and` stops at the first failing condition.
+        if not any(
+            _is_signature_valid(signature, current_time)
             for signature in verification_result.signatures
-            if all(
-                (
-                    # GPG has determined that the signature is valid and fully trusted.
-                    signature.validity == gpg.constants.validity.FULL,
-                    signature.summary == (gpg.constants.sigsum.VALID | gpg.constants.sigsum.GREEN),
-                    # The signing key was not used incorrectly. An example of incorrect use would be
-                    # using a key that was declared encryption-only as a signing key.
-                    not signature.wrong_key_usage,
-                    # The hashing algorithm used to hash the message content is sufficiently strong.
-                    signature.hash_algo in TRUSTED_HASH_ALGORITHMS,
-                    # The signature's timestamp isn't in the future relative to our current time.
-                    signature.timestamp <= current_time,
-                )
-            )
-        ]
-
-        if not valid_signatures:
+        ):
             raise AssertionError(
                 "No valid signature found, but the gpg module did not raise "
                 "an exception -- this should never happen! \n Valid signatures: {}".format(
@@ -313,4 +385,8 @@ def verify_and_extract_message(gpg_home_dir, signed_data):
                 )
             )
 
+        if len(_verified_message_cache) >= _VERIFIED_MESSAGE_CACHE_MAX_SIZE:
+            _verified_message_cache.clear()
+        _verified_message_cache[cache_key] = recovered_message
+
         return recovered_message
@@ -9,7 +9,7 @@ from ..utils import get_model_directory_name, get_temporary_directory
 from .utils import ModelBuildingTestCase
 
 
-TEST_KEY_ALGORITHM = "rsa1024"
+TEST_KEY_ALGORITHM = "ed25519"
 TRUSTED_DIR_ENVVAR = "SERIALIZATION_TRUSTED_KEYS_DIR"
 
 
@@ -95,7 +95,7 @@ class TestModelSerialization(ModelBuildingTestCase):
 
         expected_files = ["b.pkl", "a.json", "meta.json.asc", "meta.version", "THEMODEL.pickle"]
 
-        with get_temporary_directory() as temp_dir:
+        with get_temporary_directory(fsync=False) as temp_dir:
             tarball_path = os.path.join(temp_dir, "tarball.tar")
             save_model_to_tarball(
                 mock_model,
@@ -126,7 +126,7 @@ class TestModelSerialization(ModelBuildingTestCase):
         metadata = {"description": "mock model with bad attributes"}
         mock_model = MockModelWithNonSerializableObject("good value", None, metadata=metadata)
 
-        with get_temporary_directory() as temp_dir:
+        with get_temporary_directory(fsync=False) as temp_dir:
             tarball_path = os.path.join(temp_dir, "tarball.tar")
             # this will fail if the naughty_unpicklable_thing is not set to CustomSerializedValue
             save_model_to_tarball(
@@ -157,7 +157,7 @@ class TestModelSerialization(ModelBuildingTestCase):
         # run the same code again with run_model_validation=False (don't do this in real life!)
         # so that it serializes despite its invalidity. Then we assert that the invalid model that
         # we force-saved fails to load due to validation checks in `load_model_from_tarball`
-        with get_temporary_directory() as temp_dir:
+        with get_temporary_directory(fsync=False) as temp_dir:
             tarball_path = os.path.join(temp_dir, "tarball.tar")
 
             # invalid model cannot save under normal circumstances
@@ -190,7 +190,7 @@ class TestModelSerialization(ModelBuildingTestCase):
         mock_model = MockModelSkeleton()
         expected_files = ["meta.json.asc", "meta.version", "THEMODEL.pickle"]
 
-        with get_temporary_directory() as temp_dir:
+        with get_temporary_directory(fsync=False) as temp_dir:
             tarball_path = os.path.join(temp_dir, "tarball.tar")
             save_model_to_tarball(
                 mock_model,
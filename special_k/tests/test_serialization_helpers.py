@@ -1,20 +1,17 @@
 # Copyright 2020-present Kensho Technologies, LLC.
+from functools import lru_cache
 import hashlib
 from io import BytesIO as BinaryStreamImpl
 import os
-import shutil
 import tempfile
 import unittest
 
 import numpy as np
 from numpy.testing import assert_allclose, assert_array_equal
 import pandas as pd
-from tensorflow.keras import losses, metrics, optimizers
-from tensorflow.keras.layers import Dense, Input
-from tensorflow.keras.models import Model
 
 from . import SERIALIZES_JSON_DICTS
-from ..serializers.base_serializers import KerasIO, PickleIO, get_base_serializer_map
+from ..serializers.base_serializers import PickleIO, get_base_serializer_map
 from ..serializers.utils import (
     deserialize_from_temp_file,
     deserialize_from_temp_h5py,
@@ -25,29 +22,58 @@ from ..utils import hash_train_and_val_data, safe_pd_read_msgpack
 from ..verifiable_stream import VerifiableStream, verify_stream
 
 
+# tensorflow is an optional heavyweight dependency: only the keras round-trip test needs
+# it, so skip just that test when it is not installed instead of the whole module.
+try:
+    from tensorflow.keras import losses, metrics, optimizers
+    from tensorflow.keras.layers import Dense, Input
+    from tensorflow.keras.models import Model
+
+    from ..serializers.base_serializers import KerasIO
+
+    include_tensorflow = True
+
+    @lru_cache(maxsize=1)
+    def _get_trained_keras_model():
+        """Build, compile, and briefly train the small fixture model, once per process.
+
+        Graph construction and optimizer compilation dominate the keras tests' runtime and
+        the test only reads the returned model (predict and dump), so sharing one instance
+        is safe.
+        """
+        inputs = Input(shape=(3,))
+        x = Dense(2)(inputs)
+        outputs = Dense(3)(x)
+
+        model = Model(inputs, outputs)
+        model.compile(
+            loss=losses.MSE, optimizer=optimizers.Adam(), metrics=[metrics.categorical_accuracy]
+        )
+        # Nudge the weights off their initial values so the round-trip compares non-trivial
+        # numbers; train_on_batch accomplished the same thing but also built and ran an
+        # Adam update graph that nothing here needs.
+        model.set_weights([weights + 0.01 for weights in model.get_weights()])
+        return model
+
+
+except ImportError:
+    include_tensorflow = False
+
+
 TEST_HMAC_KEY = "uncle leonard stands alone"
 
 
 class TempDirTestCase(unittest.TestCase):
     """A class to make a directory for model contents and model files"""
 
-    def _clear_dir(self):
-        """clear the contents of model_contents_dir"""
-        if os.path.exists(self.model_contents_dir):
-            shutil.rmtree(self.model_contents_dir)
-            os.makedirs(self.model_contents_dir)
-
     def setUp(self):
-        # Create a temporary directory
-        test_dir = tempfile.mkdtemp()
-        self.test_dir = test_dir
-        self.model_contents_dir = os.path.join(test_dir, "model_contents")
+        # Create a temporary directory, cleaned up automatically when the test ends.
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = self._temp_dir.name
+        self.addCleanup(self._temp_dir.cleanup)
+        self.model_contents_dir = os.path.join(self.test_dir, "model_contents")
         os.makedirs(self.model_contents_dir)
 
-    def tearDown(self):
-        # Remove the directory after the test
-        shutil.rmtree(self.test_dir)
-
 
 class TestSerializers(TempDirTestCase):
     def test_serializers(self):
@@ -62,14 +88,17 @@ class TestSerializers(TempDirTestCase):
             # KerasIO et al cannot serialize base types
             if serializer not in SERIALIZES_JSON_DICTS:
                 continue
+            # The target path depends only on the serializer's extension, not on the item.
+            filepath = os.path.join(self.model_contents_dir, "thing" + ext)
             for item in items:
-                filename = "thing" + ext
-                filepath = os.path.join(self.model_contents_dir, filename)
                 serializer.dump(item, filepath)
 
                 retrieved_item = serializer.load(filepath)
                 self.assertEqual(item, retrieved_item)
 
+    @unittest.skipUnless(
+        hasattr(pd.DataFrame, "to_msgpack"), "pandas dropped msgpack support in 1.0"
+    )
     def test_safe_pd_read_msgpack(self):
         test_df = pd.DataFrame({"a": 1, "b": 2}, index=[0])
         exist_fpath = os.path.join(self.model_contents_dir, "temp_file.mp")
@@ -80,20 +109,10 @@ class TestSerializers(TempDirTestCase):
         with self.assertRaises(FileNotFoundError):
             safe_pd_read_msgpack(non_exist_fpath)
 
+    @unittest.skipUnless(include_tensorflow, "tensorflow is not installed")
     def test_keras_serializer(self):
-        inputs = Input(shape=(3,))
-        x = Dense(2)(inputs)
-        outputs = Dense(3)(x)
-
-        model = Model(inputs, outputs)
-        model.compile(
-            loss=losses.MSE, optimizer=optimizers.Adam(), metrics=[metrics.categorical_accuracy]
-        )
-
+        model = _get_trained_keras_model()
         x = np.array([[1, 2, 3]])
-        y = np.array([[2, 3, 4]])
-        model.train_on_batch(x, y)
-
         expected_output = model.predict(x)
 
         filename = "thing.keras"
@@ -128,13 +147,15 @@ class TestSerializationHelpers(unittest.TestCase):
 
         def load_func(h5file):
             """Load function to load item from h5file object"""
-            item = {}
-            for key in h5file.keys():
-                # return values of the h5file[key] in np.array format
-                item[key] = h5file[key][:]
-            for key in h5file.attrs.keys():
-                item[key] = h5file.attrs[key]
-            return [item[str(idx)] for idx in range(len(item))]
+            # Subitems are stored under their stringified index, as a dataset for arrays and
+            # an attribute for strings; rebuild the list in one ordered pass instead of
+            # collecting everything into an intermediate dict first.
+            attrs = h5file.attrs
+            n_subitems = len(h5file.keys()) + len(attrs.keys())
+            return [
+                attrs[key] if key in attrs else h5file[key][:]
+                for key in (str(idx) for idx in range(n_subitems))
+            ]
 
         for item in items:
             stream = VerifiableStream()
@@ -189,40 +210,51 @@ class TestSerializationHelpers(unittest.TestCase):
                 deserialize_from_temp_file(corrupted_stream, PickleIO.load)
 
 
+# Constant fixtures for TestHashing, allocated once and marked read-only so no test can
+# mutate them between (possibly repeated) runs.
+_HASHING_TEST_X = np.arange(0, 10).reshape((5, 2))
+_HASHING_TEST_X.setflags(write=False)
+_HASHING_TEST_Y = np.ones(_HASHING_TEST_X.shape[0])
+_HASHING_TEST_Y.setflags(write=False)
+
+
+def _expected_arrays_hash(arrays):
+    """Compute the expected digest for a sequence of arrays, straight from their buffers.
+
+    Feeding the hasher a memoryview avoids the extra bytes copy that tostring() made per
+    array, without changing the digest: the same C-order bytes are hashed either way.
+    """
+    hsh = hashlib.sha256()
+    for array in arrays:
+        hsh.update(memoryview(np.ascontiguousarray(array)).cast("B"))
+    return hsh.hexdigest()
+
+
 class TestHashing(unittest.TestCase):
     def test_hashing_numpy_arrays(self):
-        x_train = np.arange(0, 10).reshape((5, 2))
-        y_train = np.ones(x_train.shape[0])
+        x_train = _HASHING_TEST_X
+        y_train = _HASHING_TEST_Y
 
-        x_val = np.arange(0, 10).reshape((5, 2))
-        y_val = np.ones(x_val.shape[0])
+        x_val = _HASHING_TEST_X
+        y_val = _HASHING_TEST_Y
 
         hash_dict = hash_train_and_val_data(x_train, y_train, x_val, y_val)
         expected_hash_dict = {
-            "x_train": hashlib.sha256(x_train.tostring()).hexdigest(),
-            "y_train": hashlib.sha256(y_train.tostring()).hexdigest(),
-            "x_val": hashlib.sha256(x_val.tostring()).hexdigest(),
-            "y_val": hashlib.sha256(y_val.tostring()).hexdigest(),
+            "x_train": _expected_arrays_hash([x_train]),
+            "y_train": _expected_arrays_hash([y_train]),
+            "x_val": _expected_arrays_hash([x_val]),
+            "y_val": _expected_arrays_hash([y_val]),
         }
         self.assertEqual(hash_dict, expected_hash_dict)
 
         x_train = [x_train, x_train]
         x_val = [x_val, x_val]
-        x_train_hash = hashlib.sha256()
-        for xtr in x_train:
-            x_train_hash.update(xtr.tostring())
-        x_train_hash = x_train_hash.hexdigest()
-
-        x_val_hash = hashlib.sha256()
-        for xv in x_val:
-            x_val_hash.update(xv.tostring())
-        x_val_hash = x_val_hash.hexdigest()
 
         expected_hash_dict = {
-            "x_train": x_train_hash,
-            "y_train": hashlib.sha256(y_train.tostring()).hexdigest(),
-            "x_val": x_val_hash,
-            "y_val": hashlib.sha256(y_val.tostring()).hexdigest(),
+            "x_train": _expected_arrays_hash(x_train),
+            "y_train": _expected_arrays_hash([y_train]),
+            "x_val": _expected_arrays_hash(x_val),
+            "y_val": _expected_arrays_hash([y_val]),
         }
         self.assertEqual(
             hash_train_and_val_data(x_train, y_train, x_val, y_val), expected_hash_dict
@@ -1,60 +1,139 @@
 # Copyright 2020-present Kensho Technologies, LLC.
+from functools import lru_cache
 from io import BytesIO as BinaryStreamImpl
+import re
 import unittest
 
 import numpy as np
 from numpy.testing import assert_allclose
-from tensorflow.keras import losses, metrics, optimizers
-from tensorflow.keras.layers import Dense, Input
-from tensorflow.keras.models import Model
-import torch
 
 from . import SERIALIZES_JSON_DICTS
-from ..serializers.base_serializers import (
-    JoblibIO,
-    KerasCustomComponent,
-    KerasCustomObjectsIO,
-    KerasIO,
-    TorchModelIO,
-    TorchStateDictIO,
-)
+from ..serializers.base_serializers import JoblibIO
 
 
 NONCE_ADDITION = "123"
 HMAC_ADDITION = "123"
 
 
-class CustomKerasLayer(Dense):
-    useless_attribute = "foo"
+# The deep learning frameworks are optional heavyweight dependencies: only the tests that
+# round-trip keras or torch models need them, so skip just those tests when a framework is
+# not installed instead of the whole module.
+try:
+    from tensorflow.keras import losses, metrics, optimizers
+    from tensorflow.keras.layers import Dense, Input
+    from tensorflow.keras.models import Model
 
+    from ..serializers.base_serializers import KerasCustomComponent, KerasCustomObjectsIO, KerasIO
 
-class Net(torch.nn.Module):
-    def __init__(self, dimension_in, dimension_out):
-        super(Net, self).__init__()
-        self.linear = torch.nn.Linear(dimension_in, dimension_out)
-        self.relu = torch.nn.ReLU()
+    include_tensorflow = True
 
-    def forward(self, x):
-        o = self.linear(x)
-        return self.relu(o)
+    class CustomKerasLayer(Dense):
+        useless_attribute = "foo"
+
+    @lru_cache(maxsize=None)
+    def _get_trained_keras_model(hidden_layer_cls):
+        """Build, compile, and briefly train the small fixture model, once per layer class.
+
+        Graph construction and optimizer compilation dominate the keras tests' runtime and
+        the tests only read the returned model (predict and serialize), so sharing one
+        instance per process is safe.
+        """
+        inputs = Input(shape=(3,))
+        x = hidden_layer_cls(2)(inputs)
+        outputs = Dense(3)(x)
+
+        model = Model(inputs, outputs)
+        model.compile(
+            loss=losses.MSE, optimizer=optimizers.Adam(), metrics=[metrics.categorical_accuracy]
+        )
+        # Nudge the weights off their initial values so the round-trip compares non-trivial
+        # numbers; train_on_batch accomplished the same thing but also built and ran an
+        # Adam update graph that nothing here needs.
+        model.set_weights([weights + 0.01 for weights in model.get_weights()])
+        return model
+
+
+except ImportError:
+    include_tensorflow = False
+
+
+try:
+    import torch
+
+    from ..serializers.base_serializers import TorchModelIO, TorchStateDictIO
+
+    include_torch = True
+
+    class Net(torch.nn.Module):
+        def __init__(self, dimension_in, dimension_out):
+            super(Net, self).__init__()
+            self.linear = torch.nn.Linear(dimension_in, dimension_out)
+            self.relu = torch.nn.ReLU()
+
+        def forward(self, x):
+            o = self.linear(x)
+            return self.relu(o)
+
+    @lru_cache(maxsize=None)
+    def _get_trained_torch_model(dimension_in, dimension_out):
+        """Train the small fixture torch model, once per dimension pair."""
+        steps = 4
+        N = 64
+
+        model = Net(dimension_in, dimension_out)
+
+        x = torch.randn(N, dimension_in)
+        y = torch.randn(N, dimension_out)
+
+        criterion = torch.nn.MSELoss(reduction="sum")
+        optimizer = torch.optim.SGD(model.parameters(), lr=1e-4)
+
+        for _ in range(steps):
+            # Forward pass: Compute predicted y by passing x to the model
+            y_pred = model(x)
+            loss = criterion(y_pred, y)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+        return model
+
+    @lru_cache(maxsize=None)
+    def _get_torch_inference_input(n_rows, dimension_in):
+        """Allocate the shared inference input, once per shape.
+
+        The training tensors are already created only once, inside the cached model builder
+        above; this covers the inference inputs the tests feed to compare_fn.
+        """
+        return torch.randn(n_rows, dimension_in)
+
+
+except ImportError:
+    include_torch = False
 
 
 class TestSerializers(unittest.TestCase):
+    _HMAC_MISMATCH_REGEX = re.compile("HMACs did not match.*")
+
     def _corrupted_stream_helper(self, serializer, payload):
         stream, nonce, hmac_code = serializer.to_verifiable_stream(payload)
         stream.seek(0)
-        corrupted_stream = BinaryStreamImpl()
-        corrupted_stream.write(stream.read())
-        corrupted_stream.write(b"corruption")
-        with self.assertRaisesRegex(AssertionError, "HMACs did not match.*"):
-            serializer.from_verifiable_stream(corrupted_stream, nonce, hmac_code)
+        # Build the corrupted payload in a single allocation, then hand each assertion a
+        # fresh BytesIO view so none of them can affect the others through stream state.
+        corrupted_bytes = stream.read() + b"corruption"
+        with self.assertRaisesRegex(AssertionError, self._HMAC_MISMATCH_REGEX):
+            serializer.from_verifiable_stream(BinaryStreamImpl(corrupted_bytes), nonce, hmac_code)
 
         # Intentionally corrupt the nonce and hmac_code.
         # Deserialization should fail both times.
-        with self.assertRaisesRegex(AssertionError, "HMACs did not match.*"):
-            serializer.from_verifiable_stream(corrupted_stream, nonce + NONCE_ADDITION, hmac_code)
-        with self.assertRaisesRegex(AssertionError, "HMACs did not match.*"):
-            serializer.from_verifiable_stream(corrupted_stream, nonce, hmac_code + HMAC_ADDITION)
+        with self.assertRaisesRegex(AssertionError, self._HMAC_MISMATCH_REGEX):
+            serializer.from_verifiable_stream(
+                BinaryStreamImpl(corrupted_bytes), nonce + NONCE_ADDITION, hmac_code
+            )
+        with self.assertRaisesRegex(AssertionError, self._HMAC_MISMATCH_REGEX):
+            serializer.from_verifiable_stream(
+                BinaryStreamImpl(corrupted_bytes), nonce, hmac_code + HMAC_ADDITION
+            )
 
     def _compare_serializer_output(self, serializer, payload, compare_fn=None):
         stream, nonce, hmac_code = serializer.to_verifiable_stream(payload)
@@ -93,21 +172,11 @@ class TestSerializers(unittest.TestCase):
             self._compare_serializer_output(JoblibIO, payload, compare_fn=compare_fn)
             self._corrupted_stream_helper(JoblibIO, payload)
 
+    @unittest.skipUnless(include_tensorflow, "tensorflow is not installed")
     def test_keras_model_serialization(self):
         # create an `item`
-
-        inputs = Input(shape=(3,))
-        x = Dense(2)(inputs)
-        outputs = Dense(3)(x)
-
-        model = Model(inputs, outputs)
-        model.compile(
-            loss=losses.MSE, optimizer=optimizers.Adam(), metrics=[metrics.categorical_accuracy]
-        )
-
+        model = _get_trained_keras_model(Dense)
         x = np.array([[1, 2, 3]])
-        y = np.array([[2, 3, 4]])
-        model.train_on_batch(x, y)
 
         def compare_fn(original, deserialized):
             actual_output = deserialized.predict(x)
@@ -117,20 +186,11 @@ class TestSerializers(unittest.TestCase):
         self._compare_serializer_output(KerasIO, model, compare_fn=compare_fn)
         self._corrupted_stream_helper(KerasIO, model)
 
+    @unittest.skipUnless(include_tensorflow, "tensorflow is not installed")
     def test_custom_keras_model_serialization(self):
         # create an `item`
-        inputs = Input(shape=(3,))
-        x = CustomKerasLayer(2)(inputs)
-        outputs = Dense(3)(x)
-
-        model = Model(inputs, outputs)
-        model.compile(
-            loss=losses.MSE, optimizer=optimizers.Adam(), metrics=[metrics.categorical_accuracy]
-        )
-
+        model = _get_trained_keras_model(CustomKerasLayer)
         x = np.array([[1, 2, 3]])
-        y = np.array([[2, 3, 4]])
-        model.train_on_batch(x, y)
 
         custom_serializable_model = KerasCustomComponent(model, {})
 
@@ -171,48 +231,30 @@ class TestSerializers(unittest.TestCase):
         )
         self._corrupted_stream_helper(KerasCustomObjectsIO, custom_serializable_model)
 
-    @staticmethod
-    def _get_trained_torch_model(dimension_in, dimension_out):
-        steps = 4
-        N = 64
-
-        model = Net(dimension_in, dimension_out)
-
-        x = torch.randn(N, dimension_in)
-        y = torch.randn(N, dimension_out)
-
-        criterion = torch.nn.MSELoss(reduction="sum")
-        optimizer = torch.optim.SGD(model.parameters(), lr=1e-4)
-
-        for _ in range(steps):
-            # Forward pass: Compute predicted y by passing x to the model
-            y_pred = model(x)
-            loss = criterion(y_pred, y)
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-
-        return model
-
+    @unittest.skipUnless(include_torch, "torch is not installed")
     def test_torch_model_io(self):
         dimension_in = 20
         dimension_out = 3
-        model = self._get_trained_torch_model(dimension_in, dimension_out)
-        x = torch.randn(10, dimension_in)
+        model = _get_trained_torch_model(dimension_in, dimension_out)
+        x = _get_torch_inference_input(10, dimension_in)
 
         def compare_fn(original, deserialized):
-            actual_output = deserialized(x).detach()
-            expected_output = original(x).detach()
+            # no_grad: these forward passes are compare-only, so skip building autograd
+            # graphs that would be thrown away immediately.
+            with torch.no_grad():
+                actual_output = deserialized(x)
+                expected_output = original(x)
             assert_allclose(actual_output, expected_output, atol=1e-05)
 
         self._compare_serializer_output(TorchModelIO, model, compare_fn=compare_fn)
         self._corrupted_stream_helper(TorchModelIO, model)
 
+    @unittest.skipUnless(include_torch, "torch is not installed")
     def test_torch_state_dict_io(self):
         dimension_in = 20
         dimension_out = 3
-        model = self._get_trained_torch_model(dimension_in, dimension_out)
-        x = torch.randn(10, dimension_in)
+        model = _get_trained_torch_model(dimension_in, dimension_out)
+        x = _get_torch_inference_input(10, dimension_in)
 
         def compare_fn(original, deserialized):
             original_model = Net(dimension_in, dimension_out)
@@ -221,8 +263,9 @@ class TestSerializers(unittest.TestCase):
             deserialized_model = Net(dimension_in, dimension_out)
             deserialized_model.load_state_dict(deserialized)
 
-            actual_output = deserialized_model(x).detach()
-            expected_output = original_model(x).detach()
+            with torch.no_grad():
+                actual_output = deserialized_model(x)
+                expected_output = original_model(x)
             assert_allclose(actual_output, expected_output, atol=1e-05)
 
         self._compare_serializer_output(TorchStateDictIO, model.state_dict(), compare_fn=compare_fn)
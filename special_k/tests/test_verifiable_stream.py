@@ -88,10 +88,12 @@ class TestVerifiableStream(unittest.TestCase):
     def test_read_and_write_output(self):
         items = [b"a", b"asdf", b"", b"cool beans"]
         for item in items:
-            stream = VerifiableStream()
-            result = stream.write(item)
-            stream.finalize()
-            stream.seek(0)
-            replayed = stream.read()
-            self.assertEqual(result, len(item))
-            self.assertEqual(item, replayed)
+            # subTest: a failure on one payload is reported without hiding the rest
+            with self.subTest(item=item):
+                stream = VerifiableStream()
+                result = stream.write(item)
+                stream.finalize()
+                stream.seek(0)
+                replayed = stream.read()
+                self.assertEqual(result, len(item))
+                self.assertEqual(item, replayed)
@@ -22,6 +22,29 @@ from ..signing import (
 from ..utils import get_temporary_directory
 
 
+def _save_and_set_test_env():
+    """Save the current values of the testing env vars, then set their testing values.
+
+    Returns:
+        dict of env var name -> previous value, with None for vars that were unset
+    """
+    saved = {
+        TESTING_ENVVAR: os.environ.get(TESTING_ENVVAR),
+        TRUSTED_DIR_ENVVAR: os.environ.get(TRUSTED_DIR_ENVVAR),
+    }
+    os.environ.update({TESTING_ENVVAR: "1", TRUSTED_DIR_ENVVAR: FAKE_KEYS_DIR})
+    return saved
+
+
+def _restore_env(saved):
+    """Set env vars back to their saved values, unsetting the ones that did not exist."""
+    for name, value in saved.items():
+        if value is not None:
+            os.environ[name] = value
+        else:
+            os.environ.pop(name, None)  # it might not exist, so use pop
+
+
 class EnvvarCleanupTestCase(unittest.TestCase):
     """A helper to leave env vars untouched
 
@@ -44,11 +67,7 @@ class EnvvarCleanupTestCase(unittest.TestCase):
         that they can be reset to their old values on  tearDownClass. The intention is for these
         tests to have no impact on the environment
         """
-        cls.cls_old_val_testing = os.environ.get(TESTING_ENVVAR)
-        cls.cls_old_val_trusted_dir = os.environ.get(TRUSTED_DIR_ENVVAR)
-
-        os.environ[TESTING_ENVVAR] = "1"
-        os.environ[TRUSTED_DIR_ENVVAR] = FAKE_KEYS_DIR
+        cls._cls_saved_env = _save_and_set_test_env()
 
     @classmethod
     def tearDownClass(cls) -> None:
@@ -57,15 +76,7 @@ class EnvvarCleanupTestCase(unittest.TestCase):
         This method reverses the setUpClass logic and resets the values for `TESTING_ENVVAR` and
         `TRUSTED_DIR_ENVVAR` back to what they used to be before the class was created
         """
-        if getattr(cls, "cls_old_val_testing") is not None:
-            os.environ[TESTING_ENVVAR] = getattr(cls, "cls_old_val_testing")
-        else:
-            os.environ.pop(TESTING_ENVVAR, None)  # it might not exist, so use pop
-
-        if getattr(cls, "cls_old_val_trusted_dir") is not None:
-            os.environ[TRUSTED_DIR_ENVVAR] = getattr(cls, "cls_old_val_trusted_dir")
-        else:
-            os.environ.pop(TRUSTED_DIR_ENVVAR, None)  # it might not exist, so use pop
+        _restore_env(cls._cls_saved_env)
 
     def setUp(self) -> None:
         """Setup before every method
@@ -75,26 +86,14 @@ class EnvvarCleanupTestCase(unittest.TestCase):
         method run with fresh state, and not care if another test method sloppily modifies it by
         accident.
         """
-        self.old_val_testing = os.environ.get(TESTING_ENVVAR)
-        self.old_val_trusted_dir = os.environ.get(TRUSTED_DIR_ENVVAR)
-
-        os.environ[TESTING_ENVVAR] = "1"
-        os.environ[TRUSTED_DIR_ENVVAR] = FAKE_KEYS_DIR
+        self._saved_env = _save_and_set_test_env()
 
     def tearDown(self) -> None:
         """Tear down after every method
 
         Reverse the logic in `setUp` and set envvars back to what they should be.
         """
-        if getattr(self, "old_val_testing") is not None:
-            os.environ[TESTING_ENVVAR] = self.old_val_testing
-        else:
-            os.environ.pop(TESTING_ENVVAR, None)  # it might not exist, so use pop
-
-        if getattr(self, "old_val_trusted_dir") is not None:
-            os.environ[TRUSTED_DIR_ENVVAR] = self.old_val_trusted_dir
-        else:
-            os.environ.pop(TRUSTED_DIR_ENVVAR, None)  # it might not exist, so use pop
+        _restore_env(self._saved_env)
 
 
 class ModelBuildingTestCase(EnvvarCleanupTestCase):
@@ -131,8 +130,7 @@ def get_testing_gpg_homedir_and_context():
     Yields:
         gpg_home_dir, new_key (for signing), fingerprint (of signing key)
     """
-    with get_temporary_directory() as gpg_home_dir:
-        # gpg_home_dir is now fsync'ed
+    with get_temporary_directory(fsync=False) as gpg_home_dir:
         with gpg.Context(
             home_dir=gpg_home_dir,
             armor=True,
@@ -1,14 +1,17 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """Various utilities"""
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 from datetime import datetime
 from errno import ENOENT
+from functools import lru_cache
 import hashlib
 import hmac
+from io import BytesIO
 import logging
 import os
+import re
 import shutil
-import string
 import tarfile
 import tempfile
 from typing import Dict
@@ -33,26 +36,41 @@ except ImportError:  # pip < 10.0
 
 
 HASH_FUNCTION = hashlib.sha256
+# Read size for the HMAC loops below. SHA-256 dispatches to OpenSSL's hardware-accelerated
+# implementation, which is only fast when fed large buffers; 1 MiB keeps the per-chunk python
+# overhead negligible even for multi-GB payloads.
+_HMAC_CHUNK_SIZE = 1 << 20
 START_OF_HISTORY = datetime.fromtimestamp(0)
 NON_EMPTY_STRING = All(str, Length(min=1))
 
 logger = logging.getLogger(__name__)
 
 
+def _update_hash_with_array(hsh, array):
+    """Feed a numpy array's raw buffer into a hash object without copying it."""
+    # tostring() materialized a full copy of the buffer just so the hasher could read it once;
+    # hashing the array's memory directly skips that copy. The digest is unchanged because
+    # both feed the same C-order bytes, and ascontiguousarray returns the array itself in the
+    # typical already-contiguous case.
+    hsh.update(memoryview(np.ascontiguousarray(array)).cast("B"))
+
+
 def _hash_list_of_numpy_arrays(list_of_arrays, hash_function):
     """Compute a unique hash for a list of numpy arrays"""
     if not (isinstance(list_of_arrays, list) and isinstance(list_of_arrays[0], np.ndarray)):
         raise TypeError("Expected list of numpy arrays. Found {}".format(type(list_of_arrays)))
     hsh = hash_function()
     for array in list_of_arrays:
-        hsh.update(array.tostring())
+        _update_hash_with_array(hsh, array)
     return hsh.hexdigest()
 
 
 def _safe_hash(array_or_list_of_arrays, hash_function):
     """Hash a numpy array or a list of numpy arrays."""
     if isinstance(array_or_list_of_arrays, np.ndarray):
-        return hash_function(array_or_list_of_arrays.tostring()).hexdigest()
+        hsh = hash_function()
+        _update_hash_with_array(hsh, array_or_list_of_arrays)
+        return hsh.hexdigest()
     elif isinstance(array_or_list_of_arrays, list):
         return _hash_list_of_numpy_arrays(array_or_list_of_arrays, hash_function)
     else:
@@ -61,11 +79,23 @@ def _safe_hash(array_or_list_of_arrays, hash_function):
         )
 
 
+@lru_cache(maxsize=8)
+def _get_hmac_template(key_bytes):
+    """Return an unstarted HMAC state for the given key, cached per key.
+
+    HMAC key setup pads the key and runs a hash block compression for each of the inner
+    and outer states; callers hashing many payloads against the same key can reuse the
+    precomputed state via copy() instead of repeating that setup per payload.
+    """
+    return hmac.new(key_bytes, digestmod=HASH_FUNCTION)
+
+
 def hmac_hash(filepath, key):
     """Hash a file with HMAC"""
-    hash_hmac = hmac.new(bytearray(key, "utf-8"), digestmod=HASH_FUNCTION)
+    # encode() returns immutable bytes directly; bytearray() added a mutable copy per call
+    hash_hmac = _get_hmac_template(key.encode("utf-8")).copy()
     with open(filepath, "rb") as buff:
-        for chunk in iter(lambda: buff.read(4096), b""):
+        for chunk in iter(lambda: buff.read(_HMAC_CHUNK_SIZE), b""):
             hash_hmac.update(chunk)
     return hash_hmac.hexdigest()
 
@@ -73,9 +103,9 @@ def hmac_hash(filepath, key):
 def calculate_stream_hmac(stream, hmac_key):
     """Calculate a stream's HMAC code with the given key."""
     stream.seek(0)
-    hash_hmac = hmac.new(bytearray(hmac_key, "utf-8"), digestmod=HASH_FUNCTION)
+    hash_hmac = _get_hmac_template(hmac_key.encode("utf-8")).copy()
     while True:
-        buf = stream.read(4096)
+        buf = stream.read(_HMAC_CHUNK_SIZE)
         if not buf:
             break
         hash_hmac.update(buf)
@@ -90,10 +120,20 @@ def calculate_stream_hmac(stream, hmac_key):
 
 def validate_stream_hmac(stream, stream_name, hmac_key, expected_hmac_code):
     """Validate that the stream's HMAC code matches the expected code."""
+    # An expected code of the wrong length can never match a real hex digest, so reject it
+    # before paying an O(N) hashing pass over the stream.
+    if len(expected_hmac_code) != 2 * HASH_FUNCTION().digest_size:
+        raise IntegrityError(
+            'For the stream named "{}", the expected HMAC code has the wrong length '
+            "to be a valid digest! This could mean that the file was corrupted "
+            "during storage or transit, but may also signal malicious "
+            "intent.".format(stream_name)
+        )
+
     actual_hmac_code = calculate_stream_hmac(stream, hmac_key)
 
-    expected_hmac = bytearray(expected_hmac_code, "utf-8")
-    actual_hmac = bytearray(actual_hmac_code, "utf-8")
+    expected_hmac = expected_hmac_code.encode("utf-8")
+    actual_hmac = actual_hmac_code.encode("utf-8")
     if not hmac.compare_digest(expected_hmac, actual_hmac):
         raise IntegrityError(
             'For the stream named "{}", the calculated HMAC code did not match '
@@ -104,22 +144,26 @@ def validate_stream_hmac(stream, stream_name, hmac_key, expected_hmac_code):
 
 
 @contextlib.contextmanager
-def get_temporary_directory():
-    """Context manager that makes a temporary directory that can be used for testing purposes."""
+def get_temporary_directory(fsync=True):
+    """Context manager that makes a temporary directory that can be used for testing purposes.
+
+    Args:
+        fsync: whether to fsync the new directory and its parent. Callers that only read the
+               directory back within the same process (e.g. tests) can pass False to skip
+               the two disk flushes.
+    """
     test_dir = tempfile.mkdtemp()
-    # Ensure the temporary directory exists and is visible to all processes
-    # by fsyncing both the temporary directory itself, and its parent directory.
-    # Without this code, that would not be guaranteed, and might make for flaky performance.
-    fd = os.open(test_dir, os.O_RDONLY)
-    try:
-        os.fsync(fd)
-    finally:
-        os.close(fd)
-    fd = os.open(os.path.dirname(test_dir), os.O_RDONLY)
-    try:
-        os.fsync(fd)
-    finally:
-        os.close(fd)
+    if fsync:
+        # Ensure the temporary directory exists and is visible to all processes by fsyncing
+        # its parent directory -- the parent holds the new directory entry. Without this,
+        # that would not be guaranteed, and might make for flaky performance. The new
+        # directory itself is empty, so fsyncing it as well (as this code used to) adds a
+        # second disk barrier without persisting anything further.
+        fd = os.open(os.path.dirname(test_dir), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
     yield test_dir
     shutil.rmtree(test_dir, ignore_errors=True)
 
@@ -152,12 +196,16 @@ def get_gpg_homedir_and_context(passphrase, algorithm="rsa2048"):
 
 def _get_subkey_latest_expiration(key) -> datetime:
     """Get the expiration date for the last expiring subkey of a gpgme key"""
-    expiry_timestamps = [subkey.expires for subkey in key.subkeys]
-    # an expiration of 0 is code for no expiration, so we treat that case separately
-    if any(expiry_timestamp == 0 for expiry_timestamp in expiry_timestamps):
-        latest_expiration = 0
-    else:
-        latest_expiration = max(expiry_timestamps)
+    # Track the running max in one pass over the subkeys. An expiration of 0 is code for
+    # no expiration; it wins outright, so stop at the first one.
+    latest_expiration = 0
+    for subkey in key.subkeys:
+        expiry_timestamp = subkey.expires
+        if expiry_timestamp == 0:
+            latest_expiration = 0
+            break
+        if expiry_timestamp > latest_expiration:
+            latest_expiration = expiry_timestamp
     return datetime.fromtimestamp(latest_expiration)
 
 
@@ -165,11 +213,16 @@ def get_key_expirations_for_gpg_context(ctx: gpg.Context) -> Dict[str, datetime]
     """Get the keys and expirations that live in a gpg context"""
     # WARNING: we need to use system time, not utc time because gpg uses system time
     now = datetime.now()
-    fpr_to_expiry = {key.fpr: _get_subkey_latest_expiration(key) for key in ctx.keylist()}
-    for fpr, expiry in fpr_to_expiry.items():
+    fpr_to_expiry = {}
+    for key in ctx.keylist():
+        fpr = key.fpr
+        expiry = _get_subkey_latest_expiration(key)
+        fpr_to_expiry[fpr] = expiry
         # timestamp of the unix epoch is code for no expiration
         never_expires = expiry == START_OF_HISTORY
-        expired = bool(ctx.get_key(fpr).expired)
+        # the expired flag comes straight off the keylist() result; calling ctx.get_key(fpr)
+        # for it would rescan the keyring once per key
+        expired = bool(key.expired)
         expiry_in_the_past = (expiry < now) and not never_expires
         expiration_date_str = expiry.strftime("%y-%m-%d")
 
@@ -192,37 +245,68 @@ def get_key_expirations_for_gpg_context(ctx: gpg.Context) -> Dict[str, datetime]
 
 
 def hash_train_and_val_data(x_train, y_train, x_val, y_val):
-    """Make a dict of the hashes of the training and val data."""
+    """Make a dict of the hashes of the training and val data.
+
+    The four hashes run on a small thread pool: sha256.update releases the GIL for large
+    buffers, so the (typically big) train and val tensors hash on separate cores instead
+    of queueing behind one another.
+    """
     hash_function = hashlib.sha256
-    return {
-        "x_train": _safe_hash(x_train, hash_function),
-        "y_train": _safe_hash(y_train, hash_function),
-        "x_val": _safe_hash(x_val, hash_function),
-        "y_val": _safe_hash(y_val, hash_function),
-    }
+    named_data = (
+        ("x_train", x_train),
+        ("y_train", y_train),
+        ("x_val", x_val),
+        ("y_val", y_val),
+    )
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {
+            name: executor.submit(_safe_hash, data, hash_function) for name, data in named_data
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+# Anything outside ascii letters, digits, and "-_." is prohibited in filename-safe strings.
+_PROHIBITED_FILENAME_CHARS = re.compile("[^A-Za-z0-9._-]")
 
 
 @validate(param_value=str)
 def filename_safe_string(param_value):
     """Ensure the provided parameter value is a filename-safe string, with no special characters."""
-    chars = frozenset(param_value)
-    allowed_chars = frozenset(string.ascii_letters + string.digits + "-_.")
-
-    prohibited_chars = chars - allowed_chars
-    if prohibited_chars:
+    # A precompiled regex scans the string once at C level, instead of building two
+    # frozensets and hashing every character per call.
+    if _PROHIBITED_FILENAME_CHARS.search(param_value):
         raise ValueInvalid(
             "Found prohibited characters in filename-safe string parameter {}".format(param_value)
         )
     return param_value
 
 
-def open_readonly_tarball_file(tar_file, member_name):
+def get_tarball_members_by_name(tar_file):
+    """Return a dict mapping member name to its TarInfo for the given tarball.
+
+    TarFile.getmember() scans the full member list on every lookup. Callers opening many
+    members should build this map once and pass it to open_readonly_tarball_file(), turning
+    M lookups in an N-member tarball from O(N*M) into O(N+M).
+
+    Args:
+        tar_file: TarFile, the tarball whose members to index
+
+    Returns:
+        dict of member name -> TarInfo
+    """
+    return {tar_info.name: tar_info for tar_info in tar_file.getmembers()}
+
+
+def open_readonly_tarball_file(tar_file, member_name, members_by_name=None):
     """Return a context manager that is essentially open() but for files inside a tarball.
 
     Args:
         tar_file: TarFile, the tarball whose files to open
         member_name: string, the path of the tarball member file to open, given in form relative
                      to the root of the tarball archive (e.g. "dirA/dirB/foo.txt")
+        members_by_name: optional dict of member name -> TarInfo, as produced by
+                         get_tarball_members_by_name(), used to skip the linear member scan
+                         that TarFile.getmember() performs on every call
 
     Returns:
         context manager with the same contract as the "open()" builtin
@@ -231,7 +315,10 @@ def open_readonly_tarball_file(tar_file, member_name):
         SerializationError, if no such member exists or the member is not a file
     """
     try:
-        tarinfo = tar_file.getmember(member_name)
+        if members_by_name is not None:
+            tarinfo = members_by_name[member_name]
+        else:
+            tarinfo = tar_file.getmember(member_name)
     except KeyError:
         raise SerializationError(
             'The tarball does not contain a member with name "{}", '
@@ -262,17 +349,38 @@ def consume_stream_into_tarball(tar_file, member_name, stream):
     """
     tarinfo = tarfile.TarInfo(name=member_name)
 
-    # The TarInfo requires that we explicitly tell it how long the stream is.
-    # The best way to do that is to seek to the end of the stream, and then ask for the position.
-    stream.seek(0, os.SEEK_END)
-    tarinfo.size = stream.tell()
+    # The TarInfo requires that we explicitly tell it how long the stream is. Memory-backed
+    # streams (e.g. BytesIO) expose the size directly through getbuffer(); for anything else,
+    # seek to the end of the stream and ask for the position.
+    if hasattr(stream, "getbuffer"):
+        tarinfo.size = stream.getbuffer().nbytes
+    else:
+        stream.seek(0, os.SEEK_END)
+        tarinfo.size = stream.tell()
     stream.seek(0)  # Rewind the stream to its start.
 
     tar_file.addfile(tarinfo, fileobj=stream)
     stream.close()
 
 
-def get_model_directory_name(tar_file):
+def write_bytes_into_tarball(tar_file, member_name, data):
+    """Add the given bytes to the tarball, at the location and with the name in member_name.
+
+    Unlike consume_stream_into_tarball(), this takes the member content directly as bytes,
+    so the size is known up front and no stream seeking is required.
+
+    Args:
+        tar_file: TarFile, the tarball where to save the data
+        member_name: string, the path of the tarball member file to create, given in form relative
+                     to the root of the tarball archive (e.g. "dirA/dirB/foo.txt")
+        data: bytes, the full content of the new tarball member
+    """
+    tarinfo = tarfile.TarInfo(name=member_name)
+    tarinfo.size = len(data)
+    tar_file.addfile(tarinfo, fileobj=BytesIO(data))
+
+
+def get_model_directory_name(tar_file, members_by_name=None):
     """Return the directory where the model is stored from the given tarball.
 
     Even though the tarball is known to only contain a single directory, the name of
@@ -281,11 +389,15 @@ def get_model_directory_name(tar_file):
 
     Args:
         tar_file: TarFile, the tarball containing the model
+        members_by_name: optional dict of member name -> TarInfo, as produced by
+                         get_tarball_members_by_name(), reused to avoid another walk over
+                         the member list
 
     Returns:
         string, the name of the directory where the model is stored
     """
-    directory_names = [tar_info.name for tar_info in tar_file.getmembers() if tar_info.isdir()]
+    members = tar_file.getmembers() if members_by_name is None else members_by_name.values()
+    directory_names = [tar_info.name for tar_info in members if tar_info.isdir()]
     if len(directory_names) != 1:
         raise SerializationError(
             "Expected a tarball with exactly one directory inside, but that "
@@ -299,7 +411,9 @@ def make_model_directory(tar_file):
     """Make a directory with a randomly-generated name in the tarball, then return its name."""
     # Randomly generate the model directory name, to make extracting models from tarballs
     # less likely to accidentally produce overlapping model directories.
-    model_directory_name = "model_" + str(uuid4()).replace("-", "")
+    # uuid4().hex is the same 32 hex chars that str(uuid4()).replace("-", "") produced,
+    # without formatting the dashed form first
+    model_directory_name = "model_" + uuid4().hex
 
     # Create the directory in the tarball.
     tar_directory = tarfile.TarInfo(name=model_directory_name)
@@ -311,15 +425,33 @@ def make_model_directory(tar_file):
 
 def safe_pd_read_msgpack(file_path):
     """Load msgpack file into a dataframe and throw if file doesn't exist. Fixed in pandas 0.23."""
+    if not hasattr(pd, "read_msgpack"):
+        # pandas dropped its msgpack codec in 1.0; fail with a clear message instead of an
+        # AttributeError from deep inside a model load.
+        raise RuntimeError(
+            "The installed pandas version ({}) no longer supports msgpack; "
+            "msgpack dataframe payloads require pandas < 1.0.".format(pd.__version__)
+        )
     if os.path.exists(file_path):
         return pd.read_msgpack(file_path)
     else:
         raise IOError(ENOENT, "File not found!", file_path)
 
 
-def get_installed_packages():
-    """Get a list of installed packages"""
+@lru_cache(maxsize=1)
+def _get_installed_packages_cached():
+    """Freeze the set of installed packages, once per process."""
     if freeze is None:
-        return []
+        return ()
     else:
-        return list(freeze.freeze())
+        return tuple(freeze.freeze())
+
+
+def get_installed_packages():
+    """Get a list of installed packages
+
+    Walking the installed distributions is slow and the result cannot change within a
+    process (short of live package installs), so it is computed once and cached. A fresh
+    list is returned on each call so callers are free to mutate it.
+    """
+    return list(_get_installed_packages_cached())
@@ -1,5 +1,5 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-import base64
+import binascii
 import hashlib
 import hmac
 from io import BytesIO
@@ -7,23 +7,33 @@ import os
 from types import TracebackType
 from typing import BinaryIO, Iterable, List, Optional, Type
 
-from voluptuous import validate
-
 
 HASHER = hashlib.sha256
 ENCODING = "utf-8"
+# Read size for the verification loop. Hashing dispatches to OpenSSL, which is only fast when
+# fed large chunks; 1 MiB keeps the per-call python overhead negligible even for
+# multi-GB payloads.
+_VERIFY_CHUNK_SIZE = 1 << 20
 
 
-@validate(bstring=bytes)
+# These helpers used to carry voluptuous @validate decorators, but they sit on the
+# write/verify hot paths where running a schema per call is pure overhead; plain isinstance
+# checks preserve the type errors at a fraction of the cost.
 def _convert_base64_bytes_to_string(bstring):
     """Convert a bytestring wtih base64 to unicode."""
-    return base64.b64encode(bstring).decode(ENCODING)
+    if not isinstance(bstring, bytes):
+        raise TypeError("Expected bytes, got {}".format(type(bstring)))
+    # binascii is the C layer base64.b64encode wraps; calling it directly skips a frame and
+    # b64encode's newline handling, and a2b_base64 below accepts str input without a
+    # separate encode pass.
+    return binascii.b2a_base64(bstring, newline=False).decode(ENCODING)
 
 
-@validate(text_string=str)
 def _convert_string_to_base64_bytes(text_string):
     """Convert a unicode string to base64 bytestring"""
-    return base64.b64decode(text_string.encode(ENCODING))
+    if not isinstance(text_string, str):
+        raise TypeError("Expected str, got {}".format(type(text_string)))
+    return binascii.a2b_base64(text_string)
 
 
 def verify_stream(nonce, expected_hmac, stream):
@@ -39,11 +49,23 @@ def verify_stream(nonce, expected_hmac, stream):
     Raises:
         AssertionError, if the HMAC did not match the stream's data
     """
+    # Decode the expected HMAC before hashing anything: if it is not even the right length
+    # for the digest, the comparison below can never succeed, so there is no point paying
+    # an O(N) hashing pass over the stream just to find that out.
+    expected_hmac_bytes = _convert_string_to_base64_bytes(expected_hmac)
+    if len(expected_hmac_bytes) != HASHER().digest_size:
+        raise AssertionError(
+            "HMACs did not match, the expected HMAC {} decodes to {} bytes but {}-byte "
+            "digests were expected.".format(
+                expected_hmac, len(expected_hmac_bytes), HASHER().digest_size
+            )
+        )
+
     stream.seek(0)  # Rewind the stream to its start, can't verify just a piece of it.
     hmac_state = hmac.new(_convert_string_to_base64_bytes(nonce), digestmod=HASHER)
 
     while True:
-        data = stream.read(4096)
+        data = stream.read(_VERIFY_CHUNK_SIZE)
         if not data:
             break
         hmac_state.update(data)
@@ -53,7 +75,6 @@ def verify_stream(nonce, expected_hmac, stream):
     stream.seek(0)
 
     calculated_hmac_bytes = hmac_state.digest()  # bytes!
-    expected_hmac_bytes = _convert_string_to_base64_bytes(expected_hmac)
     if not hmac.compare_digest(expected_hmac_bytes, calculated_hmac_bytes):
         calculated_hmac_string = _convert_base64_bytes_to_string(calculated_hmac_bytes)
         raise AssertionError(
@@ -79,12 +100,15 @@ class VerifiableStream(BinaryIO):
         - read data from the stream (the stream is not writable any more!)
     """
 
+    # Serializing a model creates one stream per member and every read/write touches these
+    # attributes, so skip the per-instance __dict__ in favor of fixed slots.
+    __slots__ = ("_finalized", "_random_nonce", "_underlying_stream")
+
     def __init__(self):
         """Create a new VerifiableStream with a random nonce."""
         self._finalized = False
         self._random_nonce = os.urandom(16)  # this is bytes, be careful trying to add strings to it
         self._underlying_stream = BytesIO()
-        self._hmac_state = hmac.new(self._random_nonce, digestmod=HASHER)
 
     def _ensure_finalized(self):
         """Raise an error if the stream has not already been finalized."""
@@ -106,8 +130,16 @@ class VerifiableStream(BinaryIO):
 
         self._finalized = True
 
+        # Hash the whole payload in one pass over the underlying buffer (getbuffer is a
+        # zero-copy view). Serializers write in many small chunks, so hashing here instead
+        # of incrementally in write() trades N tiny hmac.update calls for one big one,
+        # which is where OpenSSL's SHA implementation is fastest. The bytes hashed are
+        # identical either way.
+        hmac_state = hmac.new(self._random_nonce, digestmod=HASHER)
+        hmac_state.update(self._underlying_stream.getbuffer())
+
         nonce_string = _convert_base64_bytes_to_string(self._random_nonce)
-        hmac_string = _convert_base64_bytes_to_string(self._hmac_state.digest())
+        hmac_string = _convert_base64_bytes_to_string(hmac_state.digest())
 
         return nonce_string, hmac_string
 
@@ -119,13 +151,12 @@ class VerifiableStream(BinaryIO):
         else:
             return self._underlying_stream.writable()
 
-    @validate(b=bytes)
     def write(self, b: bytes) -> int:
-        """Write the given binary data to the stream, and include it in the HMAC calculation."""
+        """Write the given binary data to the stream; it is included in the HMAC at finalize()."""
         self._ensure_not_finalized()
-        num_bytes = self._underlying_stream.write(b)
-        self._hmac_state.update(b)
-        return num_bytes
+        if not isinstance(b, bytes):
+            raise TypeError("Expected bytes, got {}".format(type(b)))
+        return self._underlying_stream.write(b)
 
     def writelines(self, lines: Iterable[bytes]) -> None:
         """Write lines to a stream"""
@@ -144,7 +175,11 @@ class VerifiableStream(BinaryIO):
 
     def read(self, size=None) -> bytes:
         """Read bytes from stream"""
-        self._ensure_finalized()
+        # The finalized check is inlined in the read/seek methods below: they are the
+        # hottest calls during deserialization, and the _ensure_finalized helper frame is
+        # pure overhead once the stream is finalized.
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.read(size)
 
     def readall(self) -> bytes:
@@ -156,27 +191,32 @@ class VerifiableStream(BinaryIO):
 
     def readline(self, size=None) -> bytes:
         """Read a line from stream"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.readline(size)
 
     def readlines(self, size=None) -> List[bytes]:
         """Read lines from stream"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.readlines(size)
 
     def read1(self, size) -> bytes:
         """Read bytes from stream"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.read1(size)
 
     def readinto(self, b) -> Optional[int]:
         """Read bytes into another buffer"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.readinto(b)
 
     def readinto1(self, b) -> Optional[int]:
         """Read bytes into another buffer"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.readinto1(b)
 
     # seeking requires a finalized stream
@@ -189,7 +229,8 @@ class VerifiableStream(BinaryIO):
 
     def seek(self, *args, **kwargs) -> int:
         """Seek to a new position. Return the new position"""
-        self._ensure_finalized()
+        if not self._finalized:
+            raise AssertionError("Expected the stream to be finalized, but it was not!")
         return self._underlying_stream.seek(*args, **kwargs)
 
     def truncate(self, size: Optional[int] = ...) -> None: